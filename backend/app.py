@@ -1,50 +1,82 @@
 # app.py
-from flask import Flask, request, jsonify, Response
-from get_rh_options_app import fetch_and_update_orders, delete_cache
+from flask import Flask, request, jsonify, Response, after_this_request, stream_with_context
+from get_rh_options_app import (fetch_and_update_orders, delete_cache, sync_order_store,
+                                sessions as _rh_sessions)
 import robin_stocks.robinhood as r
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import yfinance as yf
-import json, math
+import json
+import os
+import time as _time
+import threading
+import functools
+from collections import deque
 from chatbot_service import chatbot_bp
+from serialize import columns_to_records, frame_columns, frame_records
+from bar_store import (BAR_DTYPE, INTERVAL_SECONDS, BarStore, bars_to_columns,
+                       coarser_levels, day_ts, frame_to_bars, nullable_floats,
+                       resample_bars, subtract_ranges)
+from market_calendar import session_count, settled_until
+from vix_series import DailySeries
+from singleflight import SingleFlight
+from provider_clients import ProviderRegistry
+from hot_cache import LRUCache
+from backup_store import BackupStore
+from indicators import IndicatorEngine, column_names, parse_spec
+from positions import PositionBook
+from order_store import decode_cursor, store_for
+from encoded_body import ENCODINGS, EncodedBody, gzip_stream
+from jobs import JobQueue
+from io_pool import BulkheadFull, CallTimeout, bulkhead, stats as io_stats
 
 
 DATE_FIELDS = {'Activity Date', 'Process Date', 'Settle Date'}
 
-def _clean_val(key, value):
-    """Normalise a single record value: NaN→None, dates formatted, numbers kept as numbers."""
-    # NaN / None check first (before any type conversion)
-    try:
-        if pd.isna(value):
-            return None
-    except (TypeError, ValueError):
-        pass
-    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-        return None
-    if key in DATE_FIELDS:
-        try:
-            return str(pd.to_datetime(value).strftime('%Y-%m-%d'))
-        except Exception:
-            return str(value) if value is not None else None
-    # Keep numbers as numbers (not strings) — frontend can handle them
-    if isinstance(value, (np.floating, np.integer)):
-        return float(value)
-    return value
-
-
 def clean_records(df):
     """Convert a DataFrame to clean JSON-safe records."""
-    rows = df.to_dict(orient='records')
-    return [{k: _clean_val(k, v) for k, v in row.items()} for row in rows]
+    return frame_records(df, DATE_FIELDS)
+
+
+def clean_columns(df):
+    """Convert a DataFrame to the columnar response shape ({column: [values]})."""
+    return frame_columns(df, DATE_FIELDS)
 
 
 def safe_jsonify(records):
     """Serialize a list of clean dicts as a Flask JSON Response."""
     return Response(json.dumps(records), mimetype='application/json')
 
+
+def send_encoded(entry, status=200, mimetype='application/json'):
+    """Serve an EncodedBody: 304 if the client's If-None-Match has its ETag, otherwise
+    the body in the best encoding the client accepts (from the entry's stored copies)."""
+    if status == 200 and request.if_none_match.contains_weak(entry.etag):
+        resp = Response(status=304)
+    else:
+        coding = request.accept_encodings.best_match(ENCODINGS)
+        data = entry.variant(coding) if coding else None
+        resp = Response(data if data is not None else entry.body, status=status, mimetype=mimetype)
+        if data is not None:
+            resp.headers['Content-Encoding'] = coding
+    resp.set_etag(entry.etag)
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+def send_stream(lines, mimetype):
+    """Stream ``lines`` (bytes), gzipped chunk by chunk when the client accepts it."""
+    if request.accept_encodings.best_match(['gzip']):
+        resp = Response(stream_with_context(gzip_stream(lines)), mimetype=mimetype)
+        resp.headers['Content-Encoding'] = 'gzip'
+    else:
+        resp = Response(stream_with_context(lines), mimetype=mimetype)
+    resp.vary.add('Accept-Encoding')
+    return resp
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag', 'X-Prefetch-Job'])
 
 # Register the chatbot blueprint
 app.register_blueprint(chatbot_bp)
@@ -95,8 +127,34 @@ def get_stock_data():
       'optionData': records
   })
 
+def _order_pages(store, start_date, end_date, after, limit, descending, columnar):
+  """NDJSON lines for the rows in range, one store chunk at a time.
+
+  Records mode writes one record per line; columnar mode one ``{column: [values]}``
+  line per chunk.  If ``limit`` cut the range short, a last ``{"next_cursor": ...}``
+  line says where to resume.
+  """
+  sent, cursor = 0, None
+  for chunk, cursor in store.iter_chunks(start_date, end_date, after=after, limit=limit,
+                                          descending=descending):
+      sent += len(chunk)
+      if columnar:
+          yield json.dumps(clean_columns(chunk)).encode() + b'\n'
+      else:
+          yield ''.join(json.dumps(rec) + '\n' for rec in clean_records(chunk)).encode()
+  if limit is not None and sent == limit:
+      yield json.dumps({'next_cursor': cursor}).encode() + b'\n'
+
+
 @app.route('/api/fetch-data', methods=['POST'])
 def fetch_data():
+  """Order rows in [startDate, endDate].
+
+  By default the whole range comes back as one JSON array (or columns with
+  ``format: 'columns'``).  ``stream: true`` streams NDJSON instead, and
+  ``limit``/``after`` page through the range by cursor (``order: 'desc'`` for
+  newest first); a paged JSON response is ``{records|columns, next_cursor}``.
+  """
   data = request.json
   username = data.get('username')
   password = data.get('password')
@@ -104,14 +162,108 @@ def fetch_data():
   end_date = data.get('endDate')
   print("end date is ", end_date)
   csv_file = data.get('fileName', 'orders.csv')  # Optional file name
+  columnar = data.get('format') == 'columns'      # opt-in {column: [values]} shape
+  stream = bool(data.get('stream'))
+  after = data.get('after')
+  limit = data.get('limit')
+  descending = data.get('order') == 'desc'
 
   try:
-      filtered_orders = fetch_and_update_orders(username, password, start_date, end_date, csv_file)
-      records = clean_records(pd.DataFrame(filtered_orders))
-      return safe_jsonify(records)
+      if limit is not None:
+          limit = int(limit)
+          if limit < 1:
+              return jsonify({'error': 'limit must be at least 1'}), 400
+      store = sync_order_store(csv_file, account=username or 'default', password=password)
+      _schedule_prefetch(csv_file)
+      start = pd.to_datetime(start_date) if start_date else None
+      end = pd.to_datetime(end_date) if end_date else None
+
+      if not (stream or after or limit is not None or descending):
+          # whole range: one body per (range, shape), valid until the store next changes
+          hot_key = ('fetch-data', store.path, start, end, columnar)
+          entry = _hot.get(hot_key, tag=store.version())
+          if entry is None:
+              version = store.version()
+              rows = store.query(start, end)
+              entry = EncodedBody(json.dumps(clean_columns(rows) if columnar else clean_records(rows)).encode())
+              _hot.put(hot_key, entry, len(entry), tag=version)
+          return send_encoded(entry)
+      if after:
+          decode_cursor(after)                    # reject a bad cursor before streaming starts
+      if stream:
+          lines = _order_pages(store, start, end, after, limit, descending, columnar)
+          return send_stream(lines, 'application/x-ndjson')
+
+      page, cursor = [], None
+      for chunk, cursor in store.iter_chunks(start, end, after=after, limit=limit,
+                                              descending=descending):
+          page.append(chunk)
+      rows = pd.concat(page, ignore_index=True) if page else store.query(start, end).iloc[:0]
+      more = limit is not None and len(rows) == limit
+      body = {'columns': clean_columns(rows)} if columnar else {'records': clean_records(rows)}
+      body['next_cursor'] = cursor if more else None
+      return send_encoded(EncodedBody(json.dumps(body).encode()))
+  except ValueError as e:
+      return jsonify({'error': str(e)}), 400
   except Exception as e:
       return jsonify({'error': str(e)}), 500
 
+# ── positions ──────────────────────────────────────────────────────────────────
+POSITION_DATE_FIELDS = {'openDate', 'closeDate', 'expiryDate'}
+_position_books = {}
+_position_books_lock = threading.Lock()
+
+def _position_book(csv_file):
+    store = store_for(csv_file)
+    with _position_books_lock:
+        book = _position_books.get(store.path)
+        if book is None:
+            book = _position_books[store.path] = PositionBook(store.path, load=store.query,
+                                                              stamp=store.version)
+    return book
+
+@app.route('/api/positions', methods=['POST'])
+def get_positions():
+    """Orders grouped into option positions with P&L, gain ratio and hold time.
+
+    Reads the local order store; pass username/password to sync it first.
+    Optional startDate/endDate filter on the position's first activity date,
+    status ('open' | 'closed' | 'expired') on its state.
+    """
+    data = request.json or {}
+    csv_file   = data.get('fileName', 'orders.csv')
+    start_date = data.get('startDate')
+    end_date   = data.get('endDate')
+    status     = data.get('status')
+    columnar   = data.get('format') == 'columns'
+
+    try:
+        if data.get('username'):
+            fetch_and_update_orders(data['username'], data.get('password'), start_date, end_date, csv_file)
+            _schedule_prefetch(csv_file)
+        book = _position_book(csv_file)
+        positions = book.update()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    hot_key = ('positions', book.path, start_date, end_date, status, columnar)
+    entry = _hot.get(hot_key, tag=book.version)
+    if entry is None:
+        active = positions['openDate'].fillna(positions['closeDate']).fillna(positions['expiryDate'])
+        keep = pd.Series(True, index=positions.index)
+        if start_date:
+            keep &= active >= pd.to_datetime(start_date)
+        if end_date:
+            keep &= active <= pd.to_datetime(end_date)
+        if status:
+            keep &= positions['status'] == status
+        rows = positions[keep]
+        payload = frame_columns(rows, POSITION_DATE_FIELDS) if columnar \
+            else frame_records(rows, POSITION_DATE_FIELDS)
+        entry = EncodedBody(json.dumps(payload, separators=(',', ':')).encode())
+        _hot.put(hot_key, entry, len(entry), tag=book.version)
+    return send_encoded(entry)
+
 @app.route('/api/clear-cache', methods=['POST'])
 def clear_cache():
     data = request.json
@@ -120,75 +272,24 @@ def clear_cache():
     start_date = data.get('startDate')
     end_date = data.get('endDate')
     csv_file = data.get('fileName', 'orders.csv')
+    full = bool(data.get('full'))   # also forget raw orders + sync marks → full re-download
 
     # Delete cached files
     try:
-        delete_cache(csv_file)
+        delete_cache(csv_file, full=full)
     except FileNotFoundError:
         print(f"{csv_file} not found or some error in deleting")
 
-    # Refetch data
+    # Re-derive rows and pick up anything newer than the last sync
     try:
-        filtered_orders = fetch_and_update_orders(username, password, start_date, end_date, csv_file)
+        filtered_orders = fetch_and_update_orders(username, password, start_date, end_date, csv_file,
+                                                  force=True)
+        _schedule_prefetch(csv_file)
         records = clean_records(pd.DataFrame(filtered_orders))
         return safe_jsonify(records)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/news', methods=['POST'])
-def get_news():
-    data       = request.json
-    ticker     = data.get('ticker', 'SPY').upper()
-    open_date  = data.get('open_date', '')    # YYYY-MM-DD
-    close_date = data.get('close_date', '')   # YYYY-MM-DD
-
-    try:
-        t = yf.Ticker(ticker)
-        raw_news = t.news or []
-    except Exception as e:
-        return jsonify({'error': str(e), 'items': []}), 200
-
-    # yfinance returns providerPublishTime as unix timestamp
-    from datetime import datetime, timedelta
-    try:
-        open_dt  = datetime.strptime(open_date,  '%Y-%m-%d') if open_date  else None
-        close_dt = datetime.strptime(close_date, '%Y-%m-%d') if close_date else None
-    except Exception:
-        open_dt = close_dt = None
-
-    items = []
-    for n in raw_news:
-        ts = n.get('providerPublishTime') or n.get('content', {}).get('pubDate')
-        # Convert unix ts
-        try:
-            pub = datetime.utcfromtimestamp(int(ts)) if ts and str(ts).isdigit() else None
-        except Exception:
-            pub = None
-
-        title   = n.get('title') or n.get('content', {}).get('title', '')
-        url     = n.get('link')  or n.get('content', {}).get('canonicalUrl', {}).get('url', '')
-        source  = n.get('publisher') or n.get('content', {}).get('provider', {}).get('displayName', '')
-        pub_str = pub.strftime('%Y-%m-%d') if pub else ''
-
-        # Bucket: near open, near close, or general context
-        bucket = 'context'
-        if pub and open_dt and abs((pub - open_dt).days) <= 2:
-            bucket = 'entry'
-        elif pub and close_dt and abs((pub - close_dt).days) <= 2:
-            bucket = 'exit'
-
-        if title:
-            items.append({'title': title, 'url': url, 'source': source,
-                          'date': pub_str, 'bucket': bucket})
-
-    # Sort: entry first, then exit, then context
-    order = {'entry': 0, 'exit': 1, 'context': 2}
-    items.sort(key=lambda x: order.get(x['bucket'], 3))
-
-    return jsonify({'ticker': ticker, 'items': items[:12]})
-
-
-import os, time as _time
 
 # ── stock-history cache setup ──────────────────────────────────────────────────
 _BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -197,9 +298,10 @@ _BACKUP_DIR  = os.path.join(_BACKEND_DIR, 'backup')
 os.makedirs(_CACHE_DIR,  exist_ok=True)
 os.makedirs(_BACKUP_DIR, exist_ok=True)
 
-# Max age before re-fetching (intraday data changes fast, daily is stable)
+# Max age of cached bars for sessions that hadn't closed when they were fetched.
+# Bars of closed sessions never change, so they never expire (see _fresh_segments).
 _CACHE_TTL = {'1m': 300, '2m': 300, '5m': 600, '15m': 1800,
-              '30m': 3600, '1h': 14400, '1d': 86400}
+              '30m': 1800, '1h': 1800, '1d': 3600}
 
 # yfinance only keeps intraday history back N days from today
 _INTERVAL_MAX_AGE_DAYS = {
@@ -213,48 +315,194 @@ _INTERVAL_FALLBACK = {
 def _cache_key(ticker, fetch_start, fetch_end, interval):
     return f"{ticker}_{fetch_start}_{fetch_end}_{interval}".replace('/', '-')
 
-def _load_stock_cache(key, interval):
-    path = os.path.join(_CACHE_DIR, f"{key}.json")
-    if not os.path.exists(path):
-        return None
+# Columnar bar files (one per ticker/interval) with merged date coverage per file
+_bar_store = BarStore(os.path.join(_CACHE_DIR, 'bars'),
+                      max_open=int(os.environ.get('BAR_STORE_MAX_OPEN', '128')))
+# Deduplicated delta log of everything fetched, with age/size retention
+_backups = BackupStore(os.path.join(_BACKUP_DIR, 'store'),
+                       max_age_days=float(os.environ.get('BACKUP_MAX_AGE_DAYS', '30')),
+                       max_bytes=int(float(os.environ.get('BACKUP_MAX_MB', '512')) * 1024 * 1024),
+                       compact_every=float(os.environ.get('BACKUP_COMPACT_EVERY', '3600')))
+_backups.start_compactor()
+# Identical in-flight resolutions/fetches wait on one leader instead of racing
+_flights = SingleFlight()
+# Indicator series per (ticker, interval, indicator, params), extended as bars arrive
+_indicators = IndicatorEngine(_bar_store)
+# Encoded response bodies for repeat replays, in front of the bar store
+_hot = LRUCache(max_entries=int(os.environ.get('HOT_CACHE_MAX_ENTRIES', '512')),
+                max_bytes=int(float(os.environ.get('HOT_CACHE_MAX_MB', '256')) * 1024 * 1024))
+_VIX = '^VIX'
+
+def _history_payload(ticker, fetch_start, fetch_end, desired, interval, provider,
+                     bars, vix_bars, columnar=False, epoch=False, indicators=()):
+    ohlcv = bars_to_columns(bars, interval, epoch)
+    for name, params in indicators:
+        columns = _indicators.window(ticker, interval, name, params, bars)
+        for out, col in column_names(name, params, columns).items():
+            ohlcv[col] = nullable_floats(columns[out])
+    vix = bars_to_columns(vix_bars, '1d', epoch)
+    vix = {'datetime': vix['datetime'], 'vix': vix['Close']}
+    if not columnar:
+        ohlcv, vix = columns_to_records(ohlcv), columns_to_records(vix)
+    return {
+        'ticker':     ticker,
+        'interval':   interval,
+        'requested_interval': desired,
+        'provider':   provider,
+        'start_date': fetch_start,
+        'end_date':   fetch_end,
+        'format':     'columns' if columnar else 'records',
+        'ohlcv':      ohlcv,
+        'vix':        vix,
+    }
+
+def _fresh_segments(ticker, interval, kind):
+    """Cached segments still trusted now.
+
+    Dates whose session had closed when the segment was fetched are permanent;
+    the still-open tail is only trusted for the interval's TTL, after which it
+    is trimmed off and shows up as a gap to refresh on its own.
+    """
     ttl = _CACHE_TTL.get(interval, 86400)
-    if _time.time() - os.path.getmtime(path) > ttl:
-        return None          # stale — re-fetch
-    with open(path) as f:
-        return json.load(f)
-
-def _save_stock_cache(key, payload, interval):
-    # Primary cache (overwritten each fetch)
-    cache_path = os.path.join(_CACHE_DIR, f"{key}.json")
-    with open(cache_path, 'w') as f:
-        json.dump(payload, f)
-    # Timestamped backup (never overwritten)
-    from datetime import datetime as _dt
-    ts = _dt.now().strftime('%Y%m%d_%H%M%S')
-    backup_path = os.path.join(_BACKUP_DIR, f"{key}_{ts}.json")
-    with open(backup_path, 'w') as f:
-        json.dump(payload, f)
-
-
-def _df_to_records(df):
-    records = []
-    for _, row in df.iterrows():
-        rec = {}
-        for col in df.columns:
-            val = row[col]
-            try:
-                if pd.isna(val):
-                    rec[col] = None; continue
-            except (TypeError, ValueError):
-                pass
-            if hasattr(val, 'isoformat'):
-                rec[col] = val.isoformat()
-            elif isinstance(val, (np.floating, np.integer)):
-                rec[col] = float(val)
-            else:
-                rec[col] = val
-        records.append(rec)
-    return records
+    now = _time.time()
+    fresh = []
+    for seg in _bar_store.segments(ticker, interval, kind):
+        if now - seg[2] <= ttl:
+            fresh.append(seg)
+            continue
+        final_until = min(seg[1], settled_until(seg[2]))
+        if final_until > seg[0]:
+            fresh.append([seg[0], final_until] + seg[2:])
+    return fresh
+
+# Coverage 'provider' of a still-open range the providers had no bars for yet
+_EMPTY = 'empty'
+
+def _missing_ranges(ticker, fetch_start, fetch_end, interval, retry_coarser=False):
+    """Sub-ranges of the window with neither fresh bars nor a fresh 'served coarser' marker."""
+    known = _fresh_segments(ticker, interval, 'coverage')
+    if not retry_coarser:
+        known += _fresh_segments(ticker, interval, 'unavailable')
+    return [g for g in subtract_ranges(fetch_start, fetch_end, known) if session_count(*g) > 0]
+
+def _normalize_frame(df):
+    """Provider frame → flat columns with a 'datetime' column."""
+    # Flatten MultiIndex columns yfinance sometimes produces
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [col[0] for col in df.columns]
+    df = df.reset_index()
+    dt_col = 'Datetime' if 'Datetime' in df.columns else 'Date'
+    return df.rename(columns={dt_col: 'datetime'})
+
+def _store_bars(ticker, start, end, interval, bars, fetched_at, source):
+    """Swap ``bars`` in for [start, end) at one level and record it as covered."""
+    _bar_store.write(ticker, interval, bars, replace=(day_ts(start), day_ts(end)))
+    _bar_store.add_segment(ticker, interval, 'coverage', start, end, fetched_at, source,
+                           settled=settled_until)
+    _bar_store.clear_segments(ticker, interval, 'unavailable', start, end)
+
+def _derive_coarser(ticker, start, end, interval, bars, fetched_at, source):
+    """Pyramid: resample freshly stored bars into each coarser level still missing the range."""
+    source = source if ':' in source else f"{source}:{interval}"
+    for level in coarser_levels(interval):
+        for s, e in _missing_ranges(ticker, start, end, level, retry_coarser=True):
+            part = bars[(bars['t'] >= day_ts(s)) & (bars['t'] < day_ts(e))]
+            _store_bars(ticker, s, e, level, resample_bars(part, level), fetched_at, source)
+
+def _derive_from_finer(ticker, start, end, interval):
+    """Serve [start, end) by resampling finer cached bars; returns what is still missing."""
+    remaining = [(start, end)]
+    finer = [lv for lv in INTERVAL_SECONDS if interval in coarser_levels(lv)]
+    for level in reversed(finer):                      # closest level = least work
+        segs = [seg for seg in _fresh_segments(ticker, level, 'coverage') if seg[3] != _EMPTY]
+        still = []
+        for s, e in remaining:
+            for seg in segs:
+                a, b = max(s, seg[0]), min(e, seg[1])
+                if a >= b:
+                    continue
+                part = np.asarray(_bar_store.read(ticker, level, day_ts(a), day_ts(b)))
+                src = seg[3] if ':' in seg[3] else f"{seg[3]}:{level}"
+                _store_bars(ticker, a, b, interval, resample_bars(part, interval), seg[2], src)
+            still += subtract_ranges(s, e, segs)
+        remaining = still
+    return [g for g in remaining if session_count(*g) > 0]
+
+def _save_stock_cache(ticker, gap_start, gap_end, requested, interval, provider, df):
+    """Merge freshly fetched bars for one gap into the bar store and record coverage."""
+    now = _time.time()
+    bars = frame_to_bars(_normalize_frame(df), interval)
+    lo, hi = day_ts(gap_start), day_ts(gap_end)
+    previous = np.array(_bar_store.read(ticker, interval, lo, hi))
+    _store_bars(ticker, gap_start, gap_end, interval, bars, now, provider)
+    if interval != requested:
+        _bar_store.add_segment(ticker, requested, 'unavailable', gap_start, gap_end, now, interval,
+                               settled=settled_until)
+    _derive_coarser(ticker, gap_start, gap_end, interval, bars, now, provider)
+    # Backup log: only bars that are new or changed since the last store
+    _backups.put(ticker, interval, bars, previous=previous, replace=(lo, hi), ts=now,
+                 start=gap_start, end=gap_end, provider=provider)
+
+def _fill_gaps(ticker, fetch_start, fetch_end, interval, fetch, retry_coarser=False):
+    """Fill the missing sub-ranges of a window — locally from finer bars where possible,
+    otherwise from the providers. Returns the number of provider calls made."""
+    def fetch_gap(gap_start, gap_end):
+        df, actual_iv, provider = fetch(ticker, gap_start, gap_end, interval)
+        if df is None or df.empty:
+            print(f"  no data for {ticker}/{interval} gap {gap_start}..{gap_end}")
+            # nothing yet for the still-open tail (pre-market, today before the first
+            # bar): remember that for the tail TTL instead of asking again on every miss
+            now = _time.time()
+            open_from = max(gap_start, settled_until(now))
+            if open_from < gap_end:
+                _bar_store.add_segment(ticker, interval, 'coverage', open_from, gap_end, now,
+                                       _EMPTY, settled=settled_until)
+            return
+        try:
+            _save_stock_cache(ticker, gap_start, gap_end, interval, actual_iv, provider, df)
+        except Exception as ce:
+            print(f"  cache write error: {ce}")
+
+    calls = 0
+    for gap in _missing_ranges(ticker, fetch_start, fetch_end, interval, retry_coarser):
+        for gap_start, gap_end in _derive_from_finer(ticker, *gap, interval):
+            # Concurrent requests missing the same gap share one fetch and one write
+            _, leader = _flights.do(_cache_key(ticker, gap_start, gap_end, interval),
+                                    fetch_gap, gap_start, gap_end)
+            calls += leader
+    return calls
+
+def _load_stock_cache(ticker, fetch_start, fetch_end, interval, fetch, retry_coarser=False):
+    """Resolve a window against the bar store, fetching only the gaps.
+
+    Returns ``(interval, provider, bars, calls)``; the interval may be coarser
+    than requested when part of the window could only be served coarser.
+    ``retry_coarser`` re-asks providers for ranges previously served coarser
+    (e.g. once the user has supplied Alpaca/Polygon keys).
+    """
+    # Never ask providers about days that haven't happened yet
+    from datetime import datetime as _dt, timedelta as _td
+    tomorrow = (_dt.now() + _td(days=1)).strftime('%Y-%m-%d')
+    until = min(fetch_end, tomorrow)
+    lo, hi = day_ts(fetch_start), day_ts(fetch_end)
+    iv, calls = interval, 0
+    while iv is not None:
+        calls += _fill_gaps(ticker, fetch_start, until, iv, fetch,
+                            retry_coarser and iv == interval)
+        coarser = [s for s in _fresh_segments(ticker, iv, 'unavailable')
+                   if s[0] < until and s[1] > fetch_start]
+        if not coarser:
+            covered = [s for s in _fresh_segments(ticker, iv, 'coverage')
+                       if s[0] < until and s[1] > fetch_start]
+            provider = '+'.join(sorted({s[3] for s in covered} - {_EMPTY})) or None
+            return iv, provider, _bar_store.read(ticker, iv, lo, hi), calls
+        # Part of the window is only available coarser — serve all of it at that level
+        order = list(_INTERVAL_MAX_AGE_DAYS)
+        coarsest = max((s[3] for s in coarser), key=order.index)
+        if order.index(coarsest) <= order.index(iv):
+            break
+        iv = coarsest
+    return None, None, np.empty(0, dtype=BAR_DTYPE), calls
 
 
 # ── provider API keys (loaded from .env or environment) ───────────────────────
@@ -264,6 +512,28 @@ _ALPACA_KEY    = os.environ.get('ALPACA_API_KEY', '')
 _ALPACA_SECRET = os.environ.get('ALPACA_SECRET_KEY', '')
 _POLYGON_KEY   = os.environ.get('POLYGON_API_KEY', '')
 
+# One pooled client per API key; calls queue on a per-key token bucket
+# (Polygon's free tier allows 5 requests/min, Alpaca's 200/min)
+_providers = ProviderRegistry(
+    limits={'alpaca':  (float(os.environ.get('ALPACA_RATE_PER_MIN', '200')), 60.0),
+            'polygon': (float(os.environ.get('POLYGON_RATE_PER_MIN', '5')), 60.0)},
+    max_wait=float(os.environ.get('PROVIDER_MAX_WAIT', '60')),
+    max_keys=int(os.environ.get('PROVIDER_MAX_KEYS', '64')),
+)
+
+# ── provider scheduling ───────────────────────────────────────────────────────
+# 'sequential' tries yfinance → Alpaca → Polygon in turn; 'race' starts the
+# eligible providers in that order, STOCK_HEDGE_DELAY seconds apart (or as soon
+# as the previous one fails), and keeps the first good answer.
+_PROVIDER_MODE  = os.environ.get('STOCK_PROVIDER_MODE', 'sequential')
+_RACE_PROVIDERS = [p.strip() for p in
+                   os.environ.get('STOCK_RACE_PROVIDERS', 'yfinance,alpaca,polygon').split(',')
+                   if p.strip()]
+_HEDGE_DELAY    = float(os.environ.get('STOCK_HEDGE_DELAY', '0.5'))
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as _wait
+_fetch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('STOCK_FETCH_WORKERS', '8')),
+                                 thread_name_prefix='stock-fetch')
+
 
 # ── Alpaca provider (1h back to 2016 via IEX, free) ──────────────────────────
 _ALPACA_INTERVAL_MAP = {
@@ -280,14 +550,13 @@ def _fetch_alpaca(ticker, fetch_start, fetch_end, interval, key=None, secret=Non
     if iv_params is None:
         return None
     try:
-        from alpaca.data import StockHistoricalDataClient
         from alpaca.data.requests import StockBarsRequest
         from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
         from alpaca.data.enums import DataFeed
         from datetime import datetime as _dt
         _unit_map = {'Minute': TimeFrameUnit.Minute, 'Hour': TimeFrameUnit.Hour, 'Day': TimeFrameUnit.Day}
         tf = TimeFrame(int(iv_params[0]), _unit_map[iv_params[1]])
-        client = StockHistoricalDataClient(ak, as_)
+        client = _providers.client('alpaca', ak, as_)
         req = StockBarsRequest(
             symbol_or_symbols=[ticker],
             timeframe=tf,
@@ -295,6 +564,9 @@ def _fetch_alpaca(ticker, fetch_start, fetch_end, interval, key=None, secret=Non
             end=_dt.strptime(fetch_end,   '%Y-%m-%d'),
             feed=DataFeed.IEX,
         )
+        if not _providers.acquire('alpaca', ak, as_):
+            print(f"  Alpaca rate limit: gave up waiting for {ticker}/{interval}")
+            return None
         bars = client.get_stock_bars(req).df
         if bars.empty:
             return None
@@ -324,9 +596,11 @@ def _fetch_polygon(ticker, fetch_start, fetch_end, interval, key=None):
     if iv_params is None:
         return None
     try:
-        from polygon import RESTClient
         import pandas as pd
-        client = RESTClient(pk)
+        client = _providers.client('polygon', pk)
+        if not _providers.acquire('polygon', pk):
+            print(f"  Polygon rate limit: gave up waiting for {ticker}/{interval}")
+            return None
         aggs = client.get_aggs(
             ticker=ticker,
             multiplier=iv_params[0],
@@ -371,30 +645,86 @@ def _fetch_yf_with_fallback(ticker, fetch_start, fetch_end, interval):
     return None, None
 
 
+def _race_providers(calls, hedge_delay):
+    """Hedged race over ``[(name, fn)]``; each fn returns ``(df, interval)``.
+
+    The first call starts immediately, the next one after ``hedge_delay``
+    seconds or as soon as a running call comes back empty. The first non-empty
+    frame wins; calls that haven't started are cancelled and late answers from
+    calls already in flight are discarded.
+    """
+    queue, pending = list(calls), {}
+    def launch():
+        name, fn = queue.pop(0)
+        pending[_fetch_pool.submit(fn)] = name
+    launch()
+    while pending:
+        done, _ = _wait(pending, timeout=hedge_delay if queue else None,
+                        return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = pending.pop(fut)
+            try:
+                df, iv = fut.result()
+            except Exception as exc:
+                print(f"  {name} error: {exc}")
+                continue
+            if df is not None and not df.empty:
+                for other in pending:
+                    other.cancel()
+                return df, iv, name
+        if queue:
+            launch()
+    return None, None, None
+
+
 def _fetch_ohlcv(ticker, fetch_start, fetch_end, interval,
-                 alpaca_key=None, alpaca_secret=None, polygon_key=None):
-    """Try yfinance first; if it can't serve the interval, try Alpaca then Polygon."""
+                 alpaca_key=None, alpaca_secret=None, polygon_key=None,
+                 mode=None, providers=None, hedge_delay=None):
+    """Try yfinance first; if it can't serve the interval, try Alpaca then Polygon.
+
+    ``mode='race'`` (default from STOCK_PROVIDER_MODE) runs the eligible
+    providers as a hedged race instead of one after another.
+    """
     from datetime import datetime as _dt
     age_days = (_dt.now() - _dt.strptime(fetch_start, '%Y-%m-%d')).days
     yf_max   = _INTERVAL_MAX_AGE_DAYS.get(interval, 36500)
 
-    # yfinance can handle this interval for this age → use it directly
-    if age_days <= yf_max:
-        df, actual_iv = _fetch_yf_with_fallback(ticker, fetch_start, fetch_end, interval)
+    if (mode or _PROVIDER_MODE) == 'race':
+        candidates = {
+            'yfinance': (age_days <= yf_max,
+                         lambda: _fetch_yf_with_fallback(ticker, fetch_start, fetch_end, interval)),
+            'alpaca':   (bool((alpaca_key or _ALPACA_KEY) and (alpaca_secret or _ALPACA_SECRET)),
+                         lambda: (_fetch_alpaca(ticker, fetch_start, fetch_end, interval,
+                                                key=alpaca_key, secret=alpaca_secret), interval)),
+            'polygon':  (bool(polygon_key or _POLYGON_KEY),
+                         lambda: (_fetch_polygon(ticker, fetch_start, fetch_end, interval,
+                                                 key=polygon_key), interval)),
+        }
+        calls = [(name, candidates[name][1]) for name in (providers or _RACE_PROVIDERS)
+                 if name in candidates and candidates[name][0]]
+        if calls:
+            df, actual_iv, provider = _race_providers(
+                calls, _HEDGE_DELAY if hedge_delay is None else hedge_delay)
+            if df is not None:
+                return df, actual_iv, provider
+    else:
+        # yfinance can handle this interval for this age → use it directly
+        if age_days <= yf_max:
+            df, actual_iv = _fetch_yf_with_fallback(ticker, fetch_start, fetch_end, interval)
+            if df is not None:
+                return df, actual_iv, 'yfinance'
+
+        # yfinance can't provide the requested interval → try alternative providers
+        print(f"  yfinance cannot serve {interval} for {ticker} ({age_days}d old) → trying Alpaca")
+        df = _fetch_alpaca(ticker, fetch_start, fetch_end, interval,
+                           key=alpaca_key, secret=alpaca_secret)
         if df is not None:
-            return df, actual_iv, 'yfinance'
-
-    # yfinance can't provide the requested interval → try alternative providers
-    print(f"  yfinance cannot serve {interval} for {ticker} ({age_days}d old) → trying Alpaca")
-    df = _fetch_alpaca(ticker, fetch_start, fetch_end, interval,
-                       key=alpaca_key, secret=alpaca_secret)
-    if df is not None:
-        return df, interval, 'alpaca'
+            return df, interval, 'alpaca'
 
-    print(f"  Alpaca unavailable → trying Polygon")
-    df = _fetch_polygon(ticker, fetch_start, fetch_end, interval, key=polygon_key)
-    if df is not None:
-        return df, interval, 'polygon'
+        print(f"  Alpaca unavailable → trying Polygon")
+        df = _fetch_polygon(ticker, fetch_start, fetch_end, interval, key=polygon_key)
+        if df is not None:
+            return df, interval, 'polygon'
 
     # All providers failed — fall back to yfinance with a coarser interval
     print(f"  All providers failed for {interval} → yfinance fallback")
@@ -406,19 +736,29 @@ def _fetch_ohlcv(ticker, fetch_start, fetch_end, interval,
     return None, None, None
 
 
-@app.route('/api/stock-history', methods=['POST'])
-def get_stock_history():
-    data = request.json
+# ── shared VIX series (always daily) ──────────────────────────────────────────
+def _fetch_vix(ticker, start, end, interval):
+    df, actual_iv = _fetch_yf_with_fallback(ticker, start, end, interval)
+    return df, actual_iv, 'yfinance'
+
+# Loaded once per process and extended only at the tail; requests slice it by date
+_vix = DailySeries(_bar_store, _VIX,
+                   lambda start, end: _load_stock_cache(_VIX, start, end, '1d', _fetch_vix)[3],
+                   ttl=_CACHE_TTL['1d'])
+
+
+def _history_window(data):
+    """Request body → (ticker, fetch_start, fetch_end, desired interval).
+
+    Raises ValueError on malformed dates.
+    """
     ticker     = data.get('ticker', 'SPY').upper()
     start_date = data.get('start_date', '')
     end_date   = data.get('end_date', '')
 
     from datetime import datetime, timedelta
-    try:
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-        end_dt   = datetime.strptime(end_date,   '%Y-%m-%d')
-    except Exception:
-        return jsonify({'error': 'Invalid date format, expected YYYY-MM-DD'}), 400
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    end_dt   = datetime.strptime(end_date,   '%Y-%m-%d')
 
     # 30-day buffer gives RSI(14) enough warmup candles even for short trades
     buf = timedelta(days=30)
@@ -436,63 +776,488 @@ def get_stock_history():
         elif age_days <= 55: desired = '5m'
         elif age_days <= 720: desired = '1h'
         else:                desired = '1d'
+    return ticker, fetch_start, fetch_end, desired
+
+
+def _tail_expiry(ticker, interval, fetch_start, fetch_end):
+    """When the still-open tail of this window goes stale (None if it is all final)."""
+    ttl = _CACHE_TTL.get(interval, 86400)
+    tails = [seg[2] + ttl for seg in _fresh_segments(ticker, interval, 'coverage')
+             if seg[0] < fetch_end and seg[1] > fetch_start and seg[1] > settled_until(seg[2])]
+    return min(tails) if tails else None
+
+
+def _history_tag(ticker, fetch_end):
+    """Hot-tier tag for a window: the ticker's files on disk, plus VIX's only if the
+    window reaches VIX's not-yet-final tail (older VIX bars can't change)."""
+    segs = _bar_store.segments(_VIX, '1d', 'coverage')
+    vix_open = [settled_until(seg[2]) for seg in segs if seg[1] > settled_until(seg[2])]
+    reaches_tail = not segs or (bool(vix_open) and fetch_end > min(vix_open))
+    return _bar_store.version(ticker), (_bar_store.version(_VIX) if reaches_tail else None)
+
+
+def _encode(payload, from_cache=None):
+    """Pre-encode a response body; ``from_cache`` goes first so both variants share the rest."""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    if from_cache is None:
+        return body
+    head = b'{"from_cache":true' if from_cache else b'{"from_cache":false'
+    return head + (b',' + body[1:] if len(body) > 2 else b'}')
+
+
+def _as_fresh(entry):
+    """The ``from_cache: false`` variant of a cached body (same content, same ETag)."""
+    head = b'{"from_cache":true'
+    if not entry.body.startswith(head):
+        return entry
+    return EncodedBody(b'{"from_cache":false' + entry.body[len(head):], etag=entry.etag)
 
-    # Check cache
-    cache_key = _cache_key(ticker, fetch_start, fetch_end, desired)
-    cached = _load_stock_cache(cache_key, desired)
-    if cached:
-        cached['from_cache'] = True
-        return jsonify(cached)
+
+def _indicator_specs(raw):
+    """``indicators`` request field (list or comma-separated string) → tuple of (name, params)."""
+    if not raw:
+        return ()
+    if isinstance(raw, str):
+        raw = [part for part in raw.split(',') if part.strip()]
+    return tuple(dict.fromkeys(parse_spec(spec) for spec in raw))
+
+
+def _stock_history(data, fetched=False):
+    """Resolve one stock-history request body → (EncodedBody, HTTP status).
+
+    ``fetched``: the caller already downloaded this window's gaps for this request,
+    so the body is reported fresh even though it now comes out of the store.
+    """
+    try:
+        ticker, fetch_start, fetch_end, desired = _history_window(data)
+    except Exception:
+        return EncodedBody(_encode({'error': 'Invalid date format, expected YYYY-MM-DD'})), 400
 
     # Keys from request body override env vars (user-supplied from the UI)
     req_alpaca_key    = data.get('alpaca_key', '')
     req_alpaca_secret = data.get('alpaca_secret', '')
     req_polygon_key   = data.get('polygon_key', '')
+    retry    = bool(req_alpaca_key or req_polygon_key)
+    columnar = data.get('format') == 'columns'
+    epoch    = bool(data.get('epoch'))
+    try:
+        indicators = _indicator_specs(data.get('indicators'))
+    except (TypeError, ValueError) as exc:
+        return EncodedBody(_encode({'error': str(exc)})), 400
+
+    # Hot tier: the encoded body (and its compressed copies), valid while the bar files
+    # it was built from are unchanged on disk
+    hot_key = (ticker, fetch_start, fetch_end, desired, retry, columnar, epoch, indicators)
+    entry = _hot.get(hot_key, tag=_history_tag(ticker, fetch_end))
+    if entry is not None:
+        return (_as_fresh(entry) if fetched else entry), 200
 
     # Fetch — tries yfinance, then Alpaca, then Polygon, then yfinance with coarser interval
-    stock_raw, actual_interval, provider = _fetch_ohlcv(
-        ticker, fetch_start, fetch_end, desired,
-        alpaca_key=req_alpaca_key, alpaca_secret=req_alpaca_secret,
-        polygon_key=req_polygon_key,
-    )
-    if stock_raw is None:
-        return jsonify({'error': f'No price data found for {ticker} (tried yfinance, Alpaca, Polygon)'}), 404
+    def fetch_stock(tk, start, end, iv):
+        return _fetch_ohlcv(tk, start, end, iv,
+                            alpaca_key=req_alpaca_key, alpaca_secret=req_alpaca_secret,
+                            polygon_key=req_polygon_key)
+
+    # Only the parts of the window not already in the bar store hit the network;
+    # VIX resolves on the fetch pool at the same time as the underlying
+    vix_job = _fetch_pool.submit(_vix.window, fetch_start, fetch_end)
+    (actual_interval, provider, bars, calls), _ = _flights.do(
+        (_cache_key(ticker, fetch_start, fetch_end, desired), retry),
+        _load_stock_cache, ticker, fetch_start, fetch_end, desired, fetch_stock,
+        retry_coarser=retry)
+    vix_bars, vix_calls = vix_job.result()
+    if not len(bars):
+        return EncodedBody(_encode({'error': f'No price data found for {ticker} (tried yfinance, Alpaca, Polygon)'})), 404
+
+    payload = _history_payload(ticker, fetch_start, fetch_end, desired, actual_interval,
+                               provider, bars, vix_bars, columnar=columnar, epoch=epoch,
+                               indicators=indicators)
+    cached = EncodedBody(_encode(payload, from_cache=True))
+    _hot.put(hot_key, cached, len(cached),
+             tag=_history_tag(ticker, fetch_end),
+             expires_at=_tail_expiry(ticker, actual_interval, fetch_start, fetch_end))
+    if calls + vix_calls == 0 and not fetched:
+        return cached, 200
+    # same content as the cached copy, so the same ETag: a revalidation can get a 304
+    return EncodedBody(_encode(payload, from_cache=False), etag=cached.etag), 200
+
+
+@app.route('/api/provider-stats', methods=['GET'])
+def provider_stats():
+    """Pooled clients and rate-limit queue/throttle counters per provider."""
+    return jsonify({'providers': _providers.stats(), 'coalesced_fetches': _flights.coalesced,
+                    'robinhood_sessions': _rh_sessions.stats(), 'io': io_stats()})
+
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters for the in-memory stock-history tiers."""
+    return jsonify({'hot': _hot.stats(), 'indicators': _indicators.stats(), 'news': _news.stats()})
 
-    # Flatten MultiIndex columns yfinance sometimes produces
-    if isinstance(stock_raw.columns, pd.MultiIndex):
-        stock_raw.columns = [col[0] for col in stock_raw.columns]
-    stock_raw = stock_raw.reset_index()
-    dt_col = 'Datetime' if 'Datetime' in stock_raw.columns else 'Date'
-    stock_raw = stock_raw.rename(columns={dt_col: 'datetime'})
-
-    # VIX — always daily
-    vix_raw = yf.download('^VIX', start=fetch_start, end=fetch_end,
-                          interval='1d', progress=False, auto_adjust=True)
-    if isinstance(vix_raw.columns, pd.MultiIndex):
-        vix_raw.columns = [col[0] for col in vix_raw.columns]
-    vix_raw = vix_raw.reset_index()
-    vix_raw = vix_raw.rename(columns={'Date': 'datetime', 'Datetime': 'datetime'})
-
-    payload = {
-        'ticker':     ticker,
-        'interval':   actual_interval,
-        'requested_interval': desired,
-        'provider':   provider,
-        'start_date': fetch_start,
-        'end_date':   fetch_end,
-        'from_cache': False,
-        'ohlcv':      _df_to_records(stock_raw[['datetime','Open','High','Low','Close','Volume']]),
-        'vix':        _df_to_records(vix_raw[['datetime','Close']].rename(columns={'Close':'vix'})),
-    }
 
-    # Persist to cache + timestamped backup
+@app.route('/api/stock-history', methods=['POST'])
+def get_stock_history():
     try:
-        _save_stock_cache(cache_key, payload, actual_interval)
-    except Exception as ce:
-        print(f"  cache write error: {ce}")
+        entry, status = bulkhead('history').call(_stock_history, request.json)
+    except (BulkheadFull, CallTimeout) as exc:
+        return jsonify({'error': str(exc)}), exc.http_status, {'Retry-After': '1'}
+    return send_encoded(entry, status)
 
-    return jsonify(payload)
 
+def _prefetch_yf_group(interval, gaps_by_ticker):
+    """Fill many tickers' gaps at one interval with a single multi-ticker yfinance download."""
+    from datetime import datetime as _dt
+    start = min(g[0] for gaps in gaps_by_ticker.values() for g in gaps)
+    end   = max(g[1] for gaps in gaps_by_ticker.values() for g in gaps)
+    if (_dt.now() - _dt.strptime(start, '%Y-%m-%d')).days > _INTERVAL_MAX_AGE_DAYS.get(interval, 36500):
+        return 0          # too old for yfinance at this interval — per-item fallback handles it
+    tickers = sorted(gaps_by_ticker)
+    try:
+        multi = yf.download(tickers, start=start, end=end, interval=interval, group_by='ticker',
+                            progress=False, auto_adjust=True, threads=True)
+    except Exception as exc:
+        print(f"  batch yfinance {interval} error: {exc}")
+        return 1
+    if multi is None or multi.empty:
+        return 1
+    days = np.asarray(multi.index.strftime('%Y-%m-%d'))
+    for ticker in tickers:
+        try:
+            frame = multi[ticker] if isinstance(multi.columns, pd.MultiIndex) else multi
+        except KeyError:
+            continue
+        for gap_start, gap_end in gaps_by_ticker[ticker]:
+            part = frame[(days >= gap_start) & (days < gap_end)].dropna(how='all')
+            if part.empty:
+                continue
+            try:
+                _save_stock_cache(ticker, gap_start, gap_end, interval, interval, 'yfinance', part)
+            except Exception as ce:
+                print(f"  cache write error: {ce}")
+    return 1
+
+
+# A grouped download fetches the union of its tickers' gap windows for every ticker;
+# tickers only share one while that union is at most this much more than their own gaps
+BATCH_GROUP_SLACK = float(os.environ.get('STOCK_BATCH_GROUP_SLACK', '1.5'))
+
+
+def _group_gaps(gaps_by_ticker):
+    """Split one interval's tickers into groups with similar gap windows, so a
+    grouped download over-fetches at most BATCH_GROUP_SLACK× per group."""
+    def days(a, b):
+        return max((np.datetime64(b) - np.datetime64(a)).astype(int), 1)
+    spans = sorted((min(g[0] for g in gaps), max(g[1] for g in gaps), tk)
+                   for tk, gaps in gaps_by_ticker.items())
+    groups, group, lo, hi, own = [], {}, None, None, 0
+    for start, end, ticker in spans:
+        n_lo, n_hi = (start, end) if not group else (min(lo, start), max(hi, end))
+        if group and days(n_lo, n_hi) * (len(group) + 1) > BATCH_GROUP_SLACK * (own + days(start, end)):
+            groups.append(group)
+            group, own, n_lo, n_hi = {}, 0, start, end
+        group[ticker] = gaps_by_ticker[ticker]
+        lo, hi, own = n_lo, n_hi, own + days(start, end)
+    if group:
+        groups.append(group)
+    return groups
+
+
+@app.route('/api/stock-history/batch', methods=['POST'])
+def get_stock_history_batch():
+    """Many (ticker, start_date, end_date, interval) requests in one call, streamed as NDJSON.
+
+    Body: ``{"requests": [{ticker, start_date, end_date, interval}, ...], ...shared options}``.
+    Each output line is ``{"index", "status", "result"}`` and is written as soon
+    as that item is ready, in completion order.  Items the bar store already
+    covers go first; the rest wait only on their own group's download.
+    """
+    data   = request.json or {}
+    shared = {k: v for k, v in data.items() if k != 'requests'}
+    items  = [{**shared, **item} for item in data.get('requests', [])]
+
+    # Merge overlapping windows per ticker/interval and work out what is missing
+    from datetime import datetime as _dt, timedelta as _td
+    until = (_dt.now() + _td(days=1)).strftime('%Y-%m-%d')
+    windows, keys, spans_of = {}, [], []
+    for item in items:
+        try:
+            ticker, fetch_start, fetch_end, desired = _history_window(item)
+        except Exception:
+            keys.append(None)
+            spans_of.append(None)
+            continue
+        keys.append((desired, ticker))
+        spans_of.append((fetch_start, min(fetch_end, until)))
+        windows.setdefault((desired, ticker), []).append(spans_of[-1])
+    groups = {}
+    for (desired, ticker), spans in windows.items():
+        merged = []
+        for s, e in sorted(spans):
+            if merged and s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        gaps = [g for s, e in merged if s < e for g in _missing_ranges(ticker, s, e, desired)]
+        if gaps:
+            groups.setdefault(desired, {})[ticker] = gaps
+
+    # One grouped provider call per set of tickers with similar gaps (a lone ticker
+    # gains nothing from it); whatever it can't serve is fetched per item
+    downloads, group_of = [], {}
+    for interval, gaps_by_ticker in groups.items():
+        for tickers in _group_gaps(gaps_by_ticker):
+            if len(tickers) > 1:
+                group_of.update({(interval, tk): len(downloads) for tk in tickers})
+                downloads.append((interval, tickers))
+    waiting = [[] for _ in downloads]               # download → items it fills
+    for i, key in enumerate(keys):
+        if key in group_of:
+            waiting[group_of[key]].append(i)
+    # grouped items with gaps of their own are fresh data, though they are read back from the store
+    fetched = {i for g in waiting for i in g
+               if spans_of[i][0] < spans_of[i][1] and _missing_ranges(keys[i][1], *spans_of[i], keys[i][0])}
+
+    # Everything runs in the 'history' bulkhead, like single requests: an item (or group
+    # download) starts once a slot is free, and when none of this batch is in flight to
+    # free one the rest is answered 503 instead of queueing without limit
+    hist    = bulkhead('history')
+    queue   = deque([('item', i) for i, key in enumerate(keys) if key not in group_of]
+                    + [('group', g) for g in range(len(downloads))])
+    pending = {}                                    # future → ('item', index) | ('group', download)
+
+    def admit():
+        while queue:
+            kind, n = queue[0]
+            fn, args = ((_stock_history, (items[n], n in fetched)) if kind == 'item'
+                        else (_prefetch_yf_group, downloads[n]))
+            try:
+                fut = hist.submit(fn, *args)
+            except BulkheadFull:
+                if pending:
+                    return                          # one of ours will free a slot
+                raise
+            pending[fut] = queue.popleft()
+
+    def unfinished():
+        for kind, n in [*pending.values(), *queue]:
+            yield from ([n] if kind == 'item' else waiting[n])
+
+    try:
+        admit()
+    except BulkheadFull as exc:
+        return jsonify({'error': str(exc)}), exc.http_status, {'Retry-After': '1'}
+
+    def generate():
+        # Items already covered (and lone fetches) start at once; grouped items once their
+        # download is in, so the first lines never wait on the slowest download
+        while pending:
+            done, _ = _wait(pending, timeout=hist.timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                exc = CallTimeout(f"history call still running after {hist.timeout:g}s")
+                break
+            for fut in done:
+                kind, n = pending.pop(fut)
+                if kind == 'group':
+                    queue.extend(('item', i) for i in waiting[n])
+                    continue
+                try:
+                    entry, status = fut.result()
+                    body = entry.body
+                except Exception as e:
+                    body, status = _encode({'error': str(e)}), 500
+                yield b'{"index":%d,"status":%d,"result":%s}\n' % (n, status, body)
+            try:
+                admit()
+            except BulkheadFull as e:
+                exc = e
+                break
+        else:
+            return
+        body = _encode({'error': str(exc)})
+        for i in unfinished():
+            yield b'{"index":%d,"status":%d,"result":%s}\n' % (i, exc.http_status, body)
+
+    return send_stream(generate(), 'application/x-ndjson')
+
+
+# ── news ──────────────────────────────────────────────────────────────────────
+# yfinance news per ticker, normalised once and kept for NEWS_CACHE_TTL seconds;
+# bucketing against a trade's open/close dates is a filter over the cached arrays.
+NEWS_CACHE_TTL = float(os.environ.get('NEWS_CACHE_TTL', '900'))
+NEWS_MAX_ITEMS = 12
+_news = LRUCache(max_entries=int(os.environ.get('NEWS_CACHE_MAX_ENTRIES', '256')),
+                 max_bytes=64 * 1024 * 1024)
+_NEWS_BUCKETS = ('entry', 'exit', 'context')
+
+
+def _normalize_news(raw_news):
+    """yfinance items → (items [{title, url, source, date}], publish times in epoch s, -1 = unknown)."""
+    from datetime import datetime, timezone
+    items, published = [], []
+    for n in raw_news:
+        content = n.get('content') or {}
+        title = n.get('title') or content.get('title', '')
+        if not title:
+            continue
+        # unix seconds (providerPublishTime) or, in newer yfinance, an ISO pubDate
+        ts = n.get('providerPublishTime') or content.get('pubDate')
+        try:
+            pub = int(ts) if str(ts).isdigit() else \
+                int(datetime.fromisoformat(str(ts).replace('Z', '+00:00')).timestamp())
+        except ValueError:
+            pub = -1
+        items.append({'title': title,
+                      'url': n.get('link') or (content.get('canonicalUrl') or {}).get('url', ''),
+                      'source': n.get('publisher') or (content.get('provider') or {}).get('displayName', ''),
+                      'date': datetime.fromtimestamp(pub, timezone.utc).strftime('%Y-%m-%d') if pub >= 0 else ''})
+        published.append(pub)
+    return items, np.array(published, dtype=np.int64)
+
+
+def _load_news(ticker):
+    """Fetch and normalise one ticker's news (through the news bulkhead)."""
+    raw_news = bulkhead('news').call(lambda: yf.Ticker(ticker).news) or []
+    return _normalize_news(raw_news)
+
+
+def _ticker_news(ticker):
+    """Cached (items, publish times) for ``ticker``; concurrent misses share one fetch."""
+    cached = _news.get(ticker)
+    if cached is not None:
+        return cached
+    cached, leader = _flights.do(('news', ticker), _load_news, ticker)
+    if leader:
+        size = sum(len(v) for item in cached[0] for v in item.values()) + cached[1].nbytes
+        _news.put(ticker, cached, size, expires_at=_time.time() + NEWS_CACHE_TTL)
+    return cached
+
+
+def _bucket_news(items, published, open_date, close_date):
+    """Items published within 2 days of the open ('entry') or the close ('exit') first,
+    then the rest ('context'); at most NEWS_MAX_ITEMS."""
+    def near(date):
+        try:
+            day = np.datetime64(date, 's').astype(np.int64) if date else None
+        except ValueError:
+            return None
+        if day is None:
+            return np.zeros(len(published), dtype=bool)
+        return (published >= 0) & (np.abs((published - day) // 86400) <= 2)
+    entry, exit_ = near(open_date), near(close_date)
+    if entry is None or exit_ is None:                      # unparseable dates: no bucketing
+        entry = exit_ = np.zeros(len(published), dtype=bool)
+    bucket = np.where(entry, 0, np.where(exit_, 1, 2))
+    order = np.argsort(bucket, kind='stable')[:NEWS_MAX_ITEMS]
+    return [{**items[i], 'bucket': _NEWS_BUCKETS[bucket[i]]} for i in order]
+
+
+@app.route('/api/news', methods=['POST'])
+def get_news():
+    data       = request.json
+    ticker     = data.get('ticker', 'SPY').upper()
+    open_date  = data.get('open_date', '')    # YYYY-MM-DD
+    close_date = data.get('close_date', '')   # YYYY-MM-DD
+
+    try:
+        items, published = _ticker_news(ticker)
+    except (BulkheadFull, CallTimeout) as e:
+        return jsonify({'error': str(e), 'items': []}), e.http_status, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e), 'items': []}), 200
+
+    return jsonify({'ticker': ticker, 'items': _bucket_news(items, published, open_date, close_date)})
+
+
+@app.route('/api/news/batch', methods=['POST'])
+def get_news_batch():
+    """News for many trades at once: ``{"requests": [{ticker, open_date, close_date}, ...]}``.
+
+    Each distinct ticker is fetched (or read from the cache) once; the response
+    is ``{"results": [...]}`` in request order, each shaped like /api/news.
+    """
+    reqs = (request.json or {}).get('requests', [])
+    tickers = list(dict.fromkeys(str(req.get('ticker', 'SPY')).upper() for req in reqs))
+    news = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(tickers), bulkhead('news').workers))) as pool:
+        for ticker, fut in [(t, pool.submit(_ticker_news, t)) for t in tickers]:
+            try:
+                news[ticker] = fut.result()
+            except Exception as e:
+                news[ticker] = e
+
+    results = []
+    for req in reqs:
+        ticker = str(req.get('ticker', 'SPY')).upper()
+        got = news[ticker]
+        if isinstance(got, Exception):
+            results.append({'ticker': ticker, 'error': str(got), 'items': []})
+        else:
+            results.append({'ticker': ticker, 'items': _bucket_news(*got, req.get('open_date', ''),
+                                                                    req.get('close_date', ''))})
+    return jsonify({'results': results})
+
+
+# ── background prefetch ───────────────────────────────────────────────────────
+# After an order sync, every position the replay view can open gets its price
+# window (and VIX) pulled into the bar store and hot tier, so clicks are cache
+# hits.  Steps go through the history bulkhead (backing off while requests hold it)
+# and _stock_history, i.e. the usual provider rate limits.
+# PREFETCH_WORKERS=0 turns it off.
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', '2'))
+_jobs = JobQueue(workers=PREFETCH_WORKERS)
+
+
+def _prefetch_window(ticker, start_date, end_date):
+    """Warm one window with exactly the request body Trade Replay sends for it."""
+    body = {'ticker': ticker, 'start_date': start_date, 'end_date': end_date, 'interval': 'auto'}
+    for delay in (1, 2, 4, 8, 15, 30):
+        try:
+            entry, status = bulkhead('history').call(_stock_history, body)
+            break
+        except BulkheadFull:
+            _time.sleep(delay)                      # requests first; try again once they drain
+    else:
+        raise RuntimeError("history bulkhead stayed full")
+    if status != 200:
+        raise RuntimeError(json.loads(entry.body).get('error', status))
+
+
+def _prefetch_plan(csv_file):
+    """One step per replayable position window, most recently traded tickers first."""
+    pos = _position_book(csv_file).update()
+    # what computePositions in TradeReplayDemo.js keeps: opened, closed with proceeds, not expired
+    pos = pos[pos['openDate'].notna() & pos['closeDate'].notna() & pos['gainRatio'].notna()
+              & (pos['status'] != 'expired')]
+    pos = pos.assign(last=pos.groupby('ticker')['closeDate'].transform('max')) \
+             .sort_values(['last', 'ticker', 'closeDate'], ascending=[False, True, False])
+    windows = dict.fromkeys(zip(pos['ticker'], pos['openDate'].dt.strftime('%Y-%m-%d'),
+                                pos['closeDate'].dt.strftime('%Y-%m-%d')))
+    return [(f"{t} {s}..{e}", functools.partial(_prefetch_window, t, s, e)) for t, s, e in windows]
+
+
+def _schedule_prefetch(csv_file):
+    """Queue the prefetch for the order store's current contents (one job per store
+    version) and name it in the response's X-Prefetch-Job header."""
+    if PREFETCH_WORKERS <= 0:
+        return None
+    store = store_for(csv_file)
+    job = _jobs.submit('prefetch', functools.partial(_prefetch_plan, csv_file),
+                       key=('prefetch', store.path, store.version()))
+
+    @after_this_request
+    def _name_job(resp):
+        resp.headers['X-Prefetch-Job'] = job.id
+        return resp
+    return job
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress of a background job."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'unknown job {job_id}'}), 404
+    return jsonify(job.to_dict())
 
 if __name__ == '__main__':
   app.run(debug=True)
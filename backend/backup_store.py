@@ -0,0 +1,320 @@
+# backup_store.py
+"""Deduplicated, compressed backup log of fetched bars (``backend/backup``).
+
+Every provider fetch used to leave a full timestamped JSON copy behind.  Here
+a fetch only records the bars that are new or changed compared to what was
+stored before it (plus the times of bars it removed), as a zlib-compressed
+object named by the SHA-256 of its content — identical deltas are stored
+once.  ``index.jsonl`` lists the snapshots in order; replaying the deltas of
+a ticker/interval rebuilds its bars.
+
+Retention: snapshots older than ``max_age_days`` are folded into one base
+snapshot per ticker/interval, and if the objects still exceed ``max_bytes``
+whole ticker/interval series are dropped, least recently updated first — a
+series never loses its base while keeping the deltas replayed onto it.
+Unreferenced objects are then deleted.  Retention runs on a background thread
+(``start_compactor``) or from the command line, never inside ``put``.
+
+    python backup_store.py stats
+    python backup_store.py compact [--max-age-days N] [--max-mb N]
+    python backup_store.py migrate          # fold legacy {key}_{ts}.json files in
+    python backup_store.py restore TICKER INTERVAL
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:         # Windows: thread lock only
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_DTYPE, frame_to_bars, merge_bars
+
+_HEADER_END = b'\n'
+
+
+def _pack(bars, removed):
+    header = json.dumps({'rows': len(bars), 'removed': len(removed)}).encode()
+    return (header + _HEADER_END + np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes()
+            + np.asarray(removed, dtype='i8').tobytes())
+
+
+def _unpack(raw):
+    header, _, body = raw.partition(_HEADER_END)
+    n = json.loads(header)['rows']
+    split = n * BAR_DTYPE.itemsize
+    return (np.frombuffer(body[:split], dtype=BAR_DTYPE).copy(),
+            np.frombuffer(body[split:], dtype='i8').copy())
+
+
+def bar_delta(old, new, lo=None, hi=None):
+    """Rows of ``new`` not already in ``old`` byte-for-byte, and the times of
+    ``old`` bars inside [lo, hi) that ``new`` no longer has."""
+    old = np.ascontiguousarray(old, dtype=BAR_DTYPE)
+    new = np.ascontiguousarray(new, dtype=BAR_DTYPE)
+    void = np.dtype((np.void, BAR_DTYPE.itemsize))
+    changed = new[~np.isin(new.view(void), old.view(void))]
+    gone = old['t'][~np.isin(old['t'], new['t'])]
+    if lo is not None:
+        gone = gone[(gone >= lo) & (gone < hi)]
+    return changed, gone
+
+
+class BackupStore:
+    def __init__(self, root, max_age_days=30, max_bytes=512 * 1024 * 1024,
+                 compact_every=3600):
+        self.root = root
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.index_path}.lock", 'a') as lf:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], f"{digest}.z")
+
+    def _entries(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _write_object(self, raw):
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):                    # dedupe: same content, same file
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(zlib.compress(raw, 6))
+            os.replace(tmp, path)
+        return digest
+
+    def _read_object(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            return _unpack(zlib.decompress(f.read()))
+
+    def _replay(self, entries):
+        bars = np.empty(0, dtype=BAR_DTYPE)
+        for entry in entries:
+            changed, removed = self._read_object(entry['obj'])
+            if len(removed):
+                bars = bars[~np.isin(bars['t'], removed)]
+            bars = merge_bars(bars, changed)
+        return bars
+
+    def restore(self, ticker, interval):
+        """Rebuild the latest backed-up bars of one ticker/interval."""
+        entries = [e for e in self._entries() if e['ticker'] == ticker and e['interval'] == interval]
+        return self._replay(entries)
+
+    def put(self, ticker, interval, bars, previous=None, replace=None, ts=None, **info):
+        """Append a snapshot of ``bars`` as its delta against ``previous`` (default:
+        the backed-up bars).  Returns the object digest, or None when nothing changed."""
+        if previous is None:
+            previous = self.restore(ticker, interval)
+        changed, removed = bar_delta(previous, bars, *(replace or (None, None)))
+        if not len(changed) and not len(removed):
+            return None
+        with self._locked():
+            digest = self._write_object(_pack(changed, removed))
+            entry = {'ts': ts or time.time(), 'ticker': ticker, 'interval': interval,
+                     'obj': digest, 'rows': len(changed), 'removed': len(removed), **info}
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        return digest
+
+    def start_compactor(self):
+        """Apply retention every ``compact_every`` seconds on a daemon thread (0 = never)."""
+        if self._thread is None and self.compact_every > 0:
+            self._thread = threading.Thread(target=self._compact_loop, name='backup-compact',
+                                            daemon=True)
+            self._thread.start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_every)
+            try:
+                self.compact()
+            except Exception as exc:
+                print(f"  backup compaction skipped: {exc}")
+
+    def _object_sizes(self):
+        sizes = {}
+        for path in glob.glob(os.path.join(self.root, 'objects', '*', '*.z')):
+            sizes[os.path.basename(path)[:-2]] = os.path.getsize(path)
+        return sizes
+
+    def _check_restore(self, before, after, folded):
+        """Every folded series that survives must restore to the same bars as
+        before; otherwise leave the index alone."""
+        for series in folded:
+            new = [e for e in after if (e['ticker'], e['interval']) == series]
+            if not new:
+                continue
+            old = [e for e in before if (e['ticker'], e['interval']) == series]
+            if self._replay(new).tobytes() != self._replay(old).tobytes():
+                raise RuntimeError(f"compaction would change {series[0]}/{series[1]}; index left as is")
+
+    def compact(self, max_age_days=None, max_bytes=None):
+        """Apply retention: fold old snapshots into bases, trim to size, delete orphans."""
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        cutoff = time.time() - max_age_days * 86400
+        with self._locked():
+            entries = original = self._entries()
+            kept, old = [], {}
+            for entry in entries:
+                if entry['ts'] < cutoff:
+                    old.setdefault((entry['ticker'], entry['interval']), []).append(entry)
+                else:
+                    kept.append(entry)
+            bases = []
+            for (ticker, interval), group in old.items():
+                if len(group) == 1 and group[0].get('base'):
+                    bases.append(group[0])
+                    continue
+                bars = self._replay(group)
+                digest = self._write_object(_pack(bars, []))
+                bases.append({'ts': group[-1]['ts'], 'ticker': ticker, 'interval': interval,
+                              'obj': digest, 'rows': len(bars), 'removed': 0, 'base': True})
+            entries = sorted(bases, key=lambda e: e['ts']) + kept
+
+            sizes = self._object_sizes()
+            refs = {}
+            for entry in entries:
+                refs[entry['obj']] = refs.get(entry['obj'], 0) + 1
+            total = sum(sizes.get(d, 0) for d in refs)
+            dropped = 0
+            if total > max_bytes:
+                last_ts = {}
+                for entry in entries:
+                    last_ts[(entry['ticker'], entry['interval'])] = entry['ts']
+                evict = set()
+                for series in sorted(last_ts, key=last_ts.get):     # stalest series first
+                    if total <= max_bytes:
+                        break
+                    evict.add(series)
+                    for entry in entries:
+                        if (entry['ticker'], entry['interval']) == series:
+                            refs[entry['obj']] -= 1
+                            if not refs[entry['obj']]:
+                                total -= sizes.get(entry['obj'], 0)
+                            dropped += 1
+                entries = [e for e in entries if (e['ticker'], e['interval']) not in evict]
+
+            self._check_restore(original, entries, old)
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                f.writelines(json.dumps(e) + '\n' for e in entries)
+            os.replace(tmp, self.index_path)
+
+            live = {e['obj'] for e in entries}
+            removed = 0
+            for digest in sizes:
+                if digest not in live:
+                    os.remove(self._object_path(digest))
+                    removed += 1
+        return {'snapshots': len(entries), 'folded': sum(len(g) for g in old.values()),
+                'dropped': dropped, 'objects_removed': removed, 'bytes': total}
+
+    def stats(self):
+        entries = self._entries()
+        sizes = self._object_sizes()
+        return {'snapshots': len(entries), 'objects': len(sizes), 'bytes': sum(sizes.values()),
+                'series': len({(e['ticker'], e['interval']) for e in entries})}
+
+    def migrate_legacy(self, legacy_dir, delete=False):
+        """Fold old ``{ticker}_{start}_{end}_{interval}_{YYYYmmdd}_{HHMMSS}.json`` backups in.
+
+        With ``delete`` a file is removed only once its bars are in the store;
+        files that can't be read as bars are left where they are.
+        """
+        files = []
+        for path in glob.glob(os.path.join(legacy_dir, '*.json')):
+            parts = os.path.basename(path)[:-5].rsplit('_', 5)
+            if len(parts) != 6:
+                continue
+            ticker, _, _, interval, day, clock = parts
+            try:
+                ts = time.mktime(time.strptime(day + clock, '%Y%m%d%H%M%S'))
+            except ValueError:
+                continue
+            files.append((ts, path, ticker, interval))
+        stored = skipped = 0
+        for ts, path, ticker, interval in sorted(files):
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+            except ValueError:
+                skipped += 1
+                continue
+            if isinstance(payload, dict):               # pre-bar-store payloads: bars under 'ohlcv'
+                interval = payload.get('interval') or interval
+                payload = payload.get('ohlcv') or []
+            df = pd.DataFrame(payload)
+            if 'datetime' not in df:
+                skipped += 1
+                continue
+            bars = frame_to_bars(df, interval)
+            previous = self.restore(ticker, interval)
+            if self.put(ticker, interval, merge_bars(previous, bars), previous=previous, ts=ts):
+                stored += 1
+            if delete:                  # stored now, or already identical in the store
+                os.remove(path)
+        return {'files': len(files), 'snapshots': stored, 'skipped': skipped}
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('command', choices=['stats', 'compact', 'migrate', 'restore'])
+    ap.add_argument('args', nargs='*')
+    ap.add_argument('--root', default=os.path.join(here, 'backup', 'store'))
+    ap.add_argument('--max-age-days', type=float, default=None)
+    ap.add_argument('--max-mb', type=float, default=None)
+    ap.add_argument('--delete', action='store_true', help='migrate: remove legacy files afterwards')
+    args = ap.parse_args()
+    store = BackupStore(args.root)
+
+    if args.command == 'stats':
+        print(json.dumps(store.stats(), indent=2))
+    elif args.command == 'compact':
+        max_bytes = None if args.max_mb is None else int(args.max_mb * 1024 * 1024)
+        print(json.dumps(store.compact(args.max_age_days, max_bytes), indent=2))
+    elif args.command == 'migrate':
+        legacy = args.args[0] if args.args else os.path.dirname(args.root)
+        print(json.dumps(store.migrate_legacy(legacy, delete=args.delete), indent=2))
+    elif args.command == 'restore':
+        ticker, interval = args.args
+        bars = store.restore(ticker, interval)
+        print(f"{ticker}/{interval}: {len(bars)} bars")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+# bar_store.py
+"""Columnar, memory-mapped OHLCV store backing /api/stock-history.
+
+Each ticker/interval pair lives in a single ``.npy`` file holding a sorted
+structured array (epoch seconds + float OHLC + int volume).  Reads go through
+``np.load(mmap_mode='r')`` and are sliced with ``searchsorted``, so a cache hit
+costs two binary searches and returns a zero-copy view regardless of how many
+bars are stored.
+
+The sidecar records which date ranges have been fetched, so callers can work
+out the missing sub-ranges of a request and fetch only those.
+
+Read-modify-write updates hold a per-file lock — a thread lock plus an
+``flock`` on a ``.lock`` file, so several worker processes sharing the
+cache directory don't lose each other's merges.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:         # Windows: thread lock only
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+BAR_DTYPE = np.dtype([
+    ('t', '<i8'),                     # bar open time, epoch seconds (UTC)
+    ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('volume', '<i8'),
+])
+
+EXCHANGE_TZ = 'America/New_York'
+DAY = 86400
+INTERVAL_SECONDS = {'1m': 60, '2m': 120, '5m': 300, '15m': 900,
+                    '30m': 1800, '1h': 3600, '1d': DAY}
+# Intraday buckets are anchored at the 9:30 open, like yfinance's 1h bars
+_SESSION_OPEN = 9 * 3600 + 1800
+
+# Column names used by the JSON payload, in BAR_DTYPE field order
+_OHLCV_NAMES = (('open', 'Open'), ('high', 'High'), ('low', 'Low'),
+                ('close', 'Close'), ('volume', 'Volume'))
+
+
+def day_ts(date_str):
+    """'YYYY-MM-DD' → epoch seconds of that date's UTC midnight."""
+    return int(np.datetime64(date_str, 's').astype(np.int64))
+
+
+def ts_day(ts):
+    """Epoch seconds → 'YYYY-MM-DD' (UTC date)."""
+    return str(np.datetime64(int(ts), 's').astype('datetime64[D]'))
+
+
+def _datetime_column(values):
+    try:
+        return pd.to_datetime(pd.Series(values))
+    except (TypeError, ValueError):
+        # mixed UTC offsets (e.g. across a DST change) need an explicit utc=True
+        return pd.to_datetime(pd.Series(values), utc=True)
+
+
+def frame_to_bars(df, interval):
+    """Convert a provider frame (``datetime`` + Open/High/Low/Close/Volume) to a sorted bar array.
+
+    Intraday bars are keyed by their UTC open time.  Daily bars are keyed by
+    the exchange date at UTC midnight, whatever timezone the provider used.
+    """
+    if df is None or len(df) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    dt = _datetime_column(df['datetime'].to_numpy())
+    aware = dt.dt.tz is not None
+    if interval == '1d':
+        if aware:
+            dt = dt.dt.tz_convert(EXCHANGE_TZ).dt.tz_localize(None)
+        dt = dt.dt.normalize()
+    elif aware:
+        dt = dt.dt.tz_convert('UTC').dt.tz_localize(None)
+
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars['t'] = np.asarray(dt, dtype='datetime64[s]').astype(np.int64)
+    for field, col in _OHLCV_NAMES:
+        vals = pd.to_numeric(pd.Series(df[col].to_numpy()), errors='coerce')
+        if field == 'volume':
+            bars[field] = vals.fillna(0).to_numpy().astype(np.int64)
+        else:
+            bars[field] = vals.to_numpy(dtype=np.float64)
+
+    ohlc = np.column_stack([bars['open'], bars['high'], bars['low'], bars['close']])
+    bars = bars[~np.isnan(ohlc).all(axis=1)]
+    # np.unique keeps the first occurrence — reverse so the last duplicate wins
+    _, idx = np.unique(bars['t'][::-1], return_index=True)
+    return bars[::-1][idx]
+
+
+def merge_bars(old, new, replace=None):
+    """Merge ``new`` into ``old``; bars of ``old`` inside ``replace=(lo, hi)`` are dropped first."""
+    if replace is not None and len(old):
+        lo, hi = replace
+        old = old[(old['t'] < lo) | (old['t'] >= hi)]
+    both = np.concatenate([np.asarray(new, dtype=BAR_DTYPE), np.asarray(old, dtype=BAR_DTYPE)])
+    _, idx = np.unique(both['t'], return_index=True)   # first occurrence → new wins
+    return both[idx]
+
+
+def _utc_offsets(t):
+    """Exchange-time UTC offset (seconds) of each epoch in ``t``."""
+    utc = pd.DatetimeIndex(t.astype('datetime64[s]')).tz_localize('UTC')
+    local = np.asarray(utc.tz_convert(EXCHANGE_TZ).tz_localize(None), dtype='datetime64[s]')
+    return local.astype(np.int64) - t
+
+
+def session_days(t, interval):
+    """Exchange-date day number (epoch days) of each bar time in ``t``."""
+    t = np.asarray(t, dtype=np.int64)
+    if interval == '1d' or not len(t):
+        return t // DAY
+    return (t + _utc_offsets(t)) // DAY
+
+
+def coarser_levels(interval):
+    """Intervals whose bars are whole multiples of ``interval`` bars, finest first."""
+    step = INTERVAL_SECONDS[interval]
+    return [iv for iv, sec in INTERVAL_SECONDS.items() if sec > step and sec % step == 0]
+
+
+def resample_bars(bars, interval):
+    """Aggregate finer bars up to ``interval`` (first open, max high, min low, last close, summed volume)."""
+    if len(bars) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    t = np.asarray(bars['t'], dtype=np.int64)
+    local = t + _utc_offsets(t)
+    day = local - local % DAY
+    if interval == '1d':
+        keys = day
+    else:
+        step = INTERVAL_SECONDS[interval]
+        since_open = local - day - _SESSION_OPEN
+        keys = day + _SESSION_OPEN + since_open // step * step - (local - t)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+    out = np.empty(len(starts), dtype=BAR_DTYPE)
+    out['t'] = keys[starts]
+    out['open'] = bars['open'][starts]
+    out['high'] = np.fmax.reduceat(bars['high'], starts)
+    out['low'] = np.fmin.reduceat(bars['low'], starts)
+    out['close'] = bars['close'][ends]
+    out['volume'] = np.add.reduceat(bars['volume'], starts)
+    return out
+
+
+def iso_datetimes(t, interval):
+    """Vectorised ISO-8601 strings for bar times.
+
+    Daily bars render as ``YYYY-MM-DDT00:00:00``; intraday bars render in
+    exchange time with their UTC offset, matching what yfinance returns.
+    """
+    t = np.asarray(t, dtype=np.int64)
+    if len(t) == 0:
+        return []
+    if interval == '1d':
+        return np.datetime_as_string(t.astype('datetime64[s]'), unit='s').tolist()
+    offsets = _utc_offsets(t)
+    text = np.datetime_as_string((t + offsets).astype('datetime64[s]'), unit='s')
+    uniq, inv = np.unique(offsets, return_inverse=True)
+    suffix = np.array([f"{'-' if o < 0 else '+'}{abs(o) // 3600:02d}:{abs(o) % 3600 // 60:02d}"
+                       for o in uniq])[inv]
+    return np.char.add(text, suffix).tolist()
+
+
+def nullable_floats(a):
+    """Float array → list with NaN as None."""
+    a = np.asarray(a, dtype=np.float64)
+    nan = np.isnan(a)
+    if not nan.any():
+        return a.tolist()
+    out = a.astype(object)
+    out[nan] = None
+    return out.tolist()
+
+
+def bars_to_columns(bars, interval, epoch=False):
+    """Bar array → ``{datetime: [...], Open: [...], ..., Volume: [...]}``.
+
+    ``epoch=True`` sends bar times as epoch seconds instead of ISO strings.
+    """
+    cols = {'datetime': bars['t'].tolist() if epoch else iso_datetimes(bars['t'], interval)}
+    for field, name in _OHLCV_NAMES:
+        cols[name] = bars[field].tolist() if field == 'volume' else nullable_floats(bars[field])
+    return cols
+
+
+def bars_to_records(bars, interval):
+    """Bar array → list of ``{datetime, Open, High, Low, Close, Volume}`` dicts."""
+    cols = bars_to_columns(bars, interval)
+    return [dict(zip(cols, row)) for row in zip(*cols.values())]
+
+
+class BarStore:
+    """One memory-mapped bar file (plus a small JSON sidecar) per ticker/interval.
+
+    At most ``max_open`` maps are kept open (each holds a file descriptor);
+    the least recently read is dropped first, and its descriptor is released
+    once no caller still holds a view of it.
+    """
+
+    def __init__(self, root, max_open=128):
+        self.root = root
+        self.max_open = max_open
+        self._maps = OrderedDict()      # path → ((inode, mtime_ns), memmap), least recent first
+        self._lock = threading.Lock()
+        self._file_locks = {}           # path → threading.Lock
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, ticker):
+        return os.path.join(self.root, ticker.replace('/', '-'))
+
+    def bars_path(self, ticker, interval):
+        return os.path.join(self._dir(ticker), f"{interval}.npy")
+
+    def meta_path(self, ticker, interval):
+        return os.path.join(self._dir(ticker), f"{interval}.meta.json")
+
+    @contextmanager
+    def _locked(self, path):
+        with self._lock:
+            lock = self._file_locks.setdefault(path, threading.Lock())
+        with lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(f"{path}.lock", 'a') as lf:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lf, fcntl.LOCK_UN)
+
+    # ── bars ──────────────────────────────────────────────────────────────────
+    def _open(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            hit = self._maps.get(path)
+            if hit and hit[0] == stamp:
+                self._maps.move_to_end(path)
+                return hit[1]
+        arr = np.load(path, mmap_mode='r')
+        with self._lock:
+            self._maps[path] = (stamp, arr)
+            self._maps.move_to_end(path)
+            while len(self._maps) > self.max_open:
+                self._maps.popitem(last=False)
+        return arr
+
+    def read(self, ticker, interval, start_ts=None, end_ts=None):
+        """Zero-copy view of the bars with ``start_ts <= t < end_ts``."""
+        arr = self._open(self.bars_path(ticker, interval))
+        if arr is None or len(arr) == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        t = arr['t']
+        lo = 0 if start_ts is None else int(np.searchsorted(t, start_ts, 'left'))
+        hi = len(arr) if end_ts is None else int(np.searchsorted(t, end_ts, 'left'))
+        return arr[lo:hi]
+
+    def write(self, ticker, interval, bars, replace=None):
+        """Merge ``bars`` into the stored series and atomically swap the file in."""
+        path = self.bars_path(ticker, interval)
+        with self._locked(path):
+            existing = self._open(path)
+            merged = merge_bars(existing if existing is not None else np.empty(0, dtype=BAR_DTYPE),
+                                bars, replace=replace)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, merged)
+            os.replace(tmp, path)
+            with self._lock:
+                self._maps.pop(path, None)
+        return len(merged)
+
+    def version(self, ticker):
+        """Stamp of ``ticker``'s bar files and sidecars on disk; changes whenever any
+        process rewrites one (every write swaps in a new file)."""
+        try:
+            entries = os.scandir(self._dir(ticker))
+        except FileNotFoundError:
+            return ()
+        with entries:
+            return tuple(sorted((e.name, e.inode(), st.st_mtime_ns, st.st_size)
+                                for e in entries if e.name.endswith(('.npy', '.json'))
+                                for st in (e.stat(),)))
+
+    # ── sidecar metadata ──────────────────────────────────────────────────────
+    def load_meta(self, ticker, interval):
+        try:
+            with open(self.meta_path(ticker, interval)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_meta(self, ticker, interval, meta):
+        path = self.meta_path(ticker, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    # ── coverage ──────────────────────────────────────────────────────────────
+    def segments(self, ticker, interval, kind='coverage'):
+        """Stored ``[start, end, fetched_at, info]`` date segments of one kind.
+
+        ``coverage`` segments hold bars fetched from ``info`` (the provider);
+        ``unavailable`` segments record that ``info`` (a coarser interval) had
+        to serve the range instead.
+        """
+        return self.load_meta(ticker, interval).get(kind, [])
+
+    def add_segment(self, ticker, interval, kind, start, end, fetched_at, info, settled=None):
+        with self._locked(self.meta_path(ticker, interval)):
+            meta = self.load_meta(ticker, interval)
+            meta[kind] = insert_segment(meta.get(kind, []), [start, end, fetched_at, info], settled)
+            self.save_meta(ticker, interval, meta)
+
+    def clear_segments(self, ticker, interval, kind, start, end):
+        with self._locked(self.meta_path(ticker, interval)):
+            meta = self.load_meta(ticker, interval)
+            if meta.get(kind):
+                meta[kind] = remove_range(meta[kind], start, end)
+                self.save_meta(ticker, interval, meta)
+
+
+def subtract_ranges(lo, hi, ranges):
+    """Sub-ranges of ``[lo, hi)`` not covered by any ``(start, end, ...)`` in ``ranges``."""
+    gaps, cur = [], lo
+    for r in sorted(ranges, key=lambda r: r[0]):
+        if r[1] <= cur:
+            continue
+        if r[0] >= hi:
+            break
+        if r[0] > cur:
+            gaps.append((cur, r[0]))
+        cur = r[1]
+        if cur >= hi:
+            break
+    if cur < hi:
+        gaps.append((cur, hi))
+    return gaps
+
+
+def remove_range(segments, start, end):
+    """Segments with ``[start, end)`` cut out of them."""
+    out = []
+    for s in segments:
+        if s[1] <= start or s[0] >= end:
+            out.append(list(s))
+            continue
+        if s[0] < start:
+            out.append([s[0], start] + list(s[2:]))
+        if s[1] > end:
+            out.append([end, s[1]] + list(s[2:]))
+    return out
+
+
+def insert_segment(segments, seg, settled=None):
+    """Insert ``seg``, trimming whatever it overlaps, and merge adjacent segments.
+
+    Neighbours merge when they share ``info`` and either the same
+    ``fetched_at`` or — given ``settled(fetched_at)`` → first non-final date —
+    the left one is entirely final, so adopting the newer timestamp is safe.
+    """
+    out = remove_range(segments, seg[0], seg[1]) + [list(seg)]
+    out.sort(key=lambda s: s[0])
+    merged = []
+    for s in out:
+        prev = merged[-1] if merged else None
+        if prev and prev[1] == s[0] and prev[3] == s[3] and (
+                prev[2] == s[2] or (settled and s[2] >= prev[2] and prev[1] <= settled(prev[2]))):
+            prev[1], prev[2] = s[1], s[2]
+        else:
+            merged.append(s)
+    return merged
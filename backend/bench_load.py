@@ -0,0 +1,188 @@
+# bench_load.py
+"""Load test: /api/fetch-data latency while chat requests wait on a slow LLM.
+
+    python bench_load.py                              # baseline, unbounded, bulkhead
+    python bench_load.py --chat-clients 48 --llm-delay 10
+
+The app is served by a fixed pool of request threads (as a production WSGI
+server would), OPENROUTER_URL points at a local stub that answers after
+``--llm-delay`` seconds, ``--chat-clients`` clients keep /api/chat busy and
+``--fetch-clients`` clients time /api/fetch-data over a synthetic order
+history.  Modes:
+
+    baseline   no chat traffic
+    unbounded  LLM calls effectively inline (every chat holds a request thread
+               for the whole wait — how the app behaved before io_pool)
+    bulkhead   LLM calls on the IO_LLM_* bulkhead (defaults or your env)
+
+Pool sizes are read from the environment at import, so each mode runs in
+its own process.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+_MODES = {
+    'baseline': {},
+    'unbounded': {'IO_LLM_WORKERS': '1000', 'IO_LLM_QUEUE': '0', 'IO_LLM_TIMEOUT': '0'},
+    'bulkhead': {},
+}
+
+
+def _llm_stub(delay):
+    """Chat-completions stand-in that takes ``delay`` seconds per answer."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            body = json.dumps({'choices': [{'message': {'content': 'ok'}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _app_server(app, threads):
+    """The Flask app behind a fixed pool of ``threads`` request threads."""
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledServer(BaseWSGIServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+
+        def process_request(self, request, client_address):
+            self._pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledServer('127.0.0.1', 0, app)
+    server.socket.listen(256)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _seed_orders(n):
+    """Raw order cache + a fresh sync mark, so /api/fetch-data never calls Robinhood."""
+    from bench_process_orders import make_orders
+    import get_rh_options_app as rho
+    orders = make_orders(n, np.random.default_rng(0))
+    with open(rho.CACHE_FILE, 'wb') as f:
+        pickle.dump({o['id']: o for o in orders}, f)
+    rho.save_sync_state({'default': {'updated_at': max(o['updated_at'] for o in orders),
+                                     'synced_at': time.time()}})
+
+
+def run_child(args):
+    import requests
+    os.chdir(tempfile.mkdtemp(prefix='bench_load_'))
+    stub = _llm_stub(args.llm_delay)
+    os.environ.update({'OPENROUTER_URL': f'http://127.0.0.1:{stub.server_port}/v1/chat/completions',
+                       'ORDER_SYNC_MIN_INTERVAL': '1e12', 'PREFETCH_WORKERS': '0'})
+    os.environ.update(_MODES[args.mode])
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    logging.disable(logging.CRITICAL)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _seed_orders(args.orders)
+        import app as backend
+        server = _app_server(backend.app, args.server_threads)
+        base = f'http://127.0.0.1:{server.server_port}'
+        fetch_body = {'startDate': '2000-01-01', 'endDate': '2100-01-01'}
+        requests.post(f'{base}/api/fetch-data', json=fetch_body).raise_for_status()   # build + warm
+
+        stop = threading.Event()
+        chats = Counter()
+
+        def chat_client():
+            s = requests.Session()
+            while not stop.is_set():
+                r = s.post(f'{base}/api/chat', json={'provider': 'openrouter', 'api_key': 'stub',
+                                                     'query': 'How am I doing?'})
+                chats[r.status_code] += 1
+                if r.status_code == 503:
+                    time.sleep(min(float(r.headers.get('Retry-After', 1)), 1.0))
+
+        def fetch_client(n):
+            s, out = requests.Session(), []
+            for _ in range(n):
+                t = time.perf_counter()
+                s.post(f'{base}/api/fetch-data', json=fetch_body).raise_for_status()
+                out.append(time.perf_counter() - t)
+            return out
+
+        n_chat = args.chat_clients if args.mode != 'baseline' else 0
+        chat_threads = [threading.Thread(target=chat_client, daemon=True) for _ in range(n_chat)]
+        for t in chat_threads:
+            t.start()
+        time.sleep(min(args.llm_delay, 1.0) if n_chat else 0)    # let the chats pile up first
+        per_client = max(args.requests // args.fetch_clients, 1)
+        with ThreadPoolExecutor(args.fetch_clients) as ex:
+            lat = np.concatenate(list(ex.map(fetch_client, [per_client] * args.fetch_clients)))
+        stop.set()
+    ms = lat * 1000
+    print(json.dumps({'mode': args.mode, 'n': len(ms), 'p50': np.percentile(ms, 50),
+                      'p95': np.percentile(ms, 95), 'p99': np.percentile(ms, 99), 'max': ms.max(),
+                      'chats': dict(sorted(chats.items()))}), flush=True)
+    os._exit(0)     # chat clients may still be waiting on the stub
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--modes', default='baseline,unbounded,bulkhead')
+    ap.add_argument('--server-threads', type=int, default=16)
+    ap.add_argument('--chat-clients', type=int, default=24)
+    ap.add_argument('--llm-delay', type=float, default=3.0)
+    ap.add_argument('--fetch-clients', type=int, default=4)
+    ap.add_argument('--requests', type=int, default=400)
+    ap.add_argument('--orders', type=int, default=2000)
+    ap.add_argument('--mode', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.mode:
+        return run_child(args)
+
+    print(f"{args.server_threads} request threads, {args.chat_clients} chat clients "
+          f"(LLM answers in {args.llm_delay:g}s), {args.fetch_clients} fetch-data clients\n")
+    print(f"{'mode':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  chat statuses")
+    passthrough = [f'--{k.replace("_", "-")}={v}' for k, v in vars(args).items()
+                   if k not in ('modes', 'mode')]
+    for mode in args.modes.split(','):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, *passthrough],
+                             capture_output=True, text=True)
+        try:
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            print(f"{mode:<10} failed:\n{out.stderr[-2000:]}")
+            continue
+        print(f"{mode:<10} {r['p50']:9.1f} {r['p95']:9.1f} {r['p99']:9.1f} {r['max']:9.1f}  {r['chats']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# bench_serialize.py
+"""Benchmark the vectorised serializer against the old per-row/per-cell loops.
+
+    python bench_serialize.py                  # 10k, 100k, 1M rows
+    python bench_serialize.py --legacy-limit 1000000
+
+The legacy loops take minutes at 1M rows, so by default they are only timed
+up to --legacy-limit rows and extrapolated linearly above that (marked ~).
+"""
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_DTYPE, bars_to_columns
+from serialize import columns_to_records, frame_records
+
+DATE_FIELDS = {'Activity Date', 'Process Date', 'Settle Date'}
+
+
+# ── legacy implementations (as they were in app.py) ──────────────────────────
+def _legacy_clean_val(key, value):
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if key in DATE_FIELDS:
+        try:
+            return str(pd.to_datetime(value).strftime('%Y-%m-%d'))
+        except Exception:
+            return str(value) if value is not None else None
+    if isinstance(value, (np.floating, np.integer)):
+        return float(value)
+    return value
+
+
+def legacy_clean_records(df):
+    rows = df.to_dict(orient='records')
+    return [{k: _legacy_clean_val(k, v) for k, v in row.items()} for row in rows]
+
+
+def legacy_df_to_records(df):
+    records = []
+    for _, row in df.iterrows():
+        rec = {}
+        for col in df.columns:
+            val = row[col]
+            try:
+                if pd.isna(val):
+                    rec[col] = None; continue
+            except (TypeError, ValueError):
+                pass
+            if hasattr(val, 'isoformat'):
+                rec[col] = val.isoformat()
+            elif isinstance(val, (np.floating, np.integer)):
+                rec[col] = float(val)
+            else:
+                rec[col] = val
+        records.append(rec)
+    return records
+
+
+# ── synthetic data ────────────────────────────────────────────────────────────
+def make_orders(n, rng):
+    days = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, n), unit='D')
+    tickers = np.array(['TSLA', 'NVDA', 'SPY', 'AAPL', 'AMZN'])[rng.integers(0, 5, n)]
+    price = rng.uniform(0.05, 20, n).round(2)
+    price[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        'Activity Date': days.strftime('%Y-%m-%d'),
+        'Process Date': days.strftime('%Y-%m-%d'),
+        'Settle Date': (days + pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+        'Instrument': tickers,
+        'Description': [f"{t} 2024-01-19 call 100.0000" for t in tickers],
+        'Trans Code': np.array(['BTO', 'STC'])[rng.integers(0, 2, n)],
+        'Quantity': rng.integers(1, 10, n).astype(float),
+        'Price': price,
+        'Amount': (price * 100).round(2),
+    })
+
+
+def make_bars(n, rng):
+    bars = np.empty(n, dtype=BAR_DTYPE)
+    bars['t'] = 1_700_000_000 + np.arange(n) * 300
+    close = 100 + rng.standard_normal(n).cumsum()
+    bars['open'], bars['close'] = close, close
+    bars['high'], bars['low'] = close + 1, close - 1
+    bars['volume'] = rng.integers(0, 10_000, n)
+    return bars
+
+
+def bars_frame(bars):
+    return pd.DataFrame({
+        'datetime': pd.to_datetime(bars['t'], unit='s', utc=True).tz_convert('America/New_York'),
+        'Open': bars['open'], 'High': bars['high'], 'Low': bars['low'],
+        'Close': bars['close'], 'Volume': bars['volume'].astype(float),
+    })
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    json.dumps(out)
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', default='10000,100000,1000000')
+    ap.add_argument('--legacy-limit', type=int, default=100_000)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'case':<18}{'rows':>10}{'legacy s':>12}{'vectorised s':>14}{'speedup':>10}")
+    for n in [int(x) for x in args.sizes.split(',')]:
+        orders = make_orders(n, rng)
+        bars = make_bars(n, rng)
+        frame = bars_frame(bars)
+        cases = [
+            ('fetch-data rows', legacy_clean_records, (orders,),
+             lambda df: frame_records(df, DATE_FIELDS), (orders,)),
+            ('stock-history', legacy_df_to_records, (frame,),
+             lambda b: columns_to_records(bars_to_columns(b, '5m')), (bars,)),
+            ('stock-history col', legacy_df_to_records, (frame,),
+             lambda b: bars_to_columns(b, '5m'), (bars,)),
+        ]
+        for name, old, old_args, new, new_args in cases:
+            new_s = timed(new, *new_args)
+            if n <= args.legacy_limit:
+                old_s, mark = timed(old, *old_args), ' '
+            else:
+                # extrapolate from a slice at the limit
+                sliced = tuple(a.iloc[:args.legacy_limit] for a in old_args)
+                old_s, mark = timed(old, *sliced) * n / args.legacy_limit, '~'
+            print(f"{name:<18}{n:>10}{old_s:>11.3f}{mark}{new_s:>14.3f}{old_s / new_s:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,23 @@
 # backend/chatbot_service.py
 import base64
+import binascii
+import hashlib
+import json
 import os
+import time
 import warnings
 from datetime import datetime
 
 import anthropic
 import requests
 from dotenv import load_dotenv
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from openai import OpenAI
 
+from hot_cache import LRUCache
+from io_pool import BulkheadFull, CallTimeout, bulkhead
+from singleflight import SingleFlight
+
 load_dotenv()
 
 chatbot_bp = Blueprint('chatbot', __name__)
@@ -23,6 +31,26 @@ if not any([ANTHROPIC_API_KEY, OPENAI_API_KEY, OPENROUTER_API_KEY]):
                   "Set ANTHROPIC_API_KEY, OPENAI_API_KEY, or REACT_APP_OPENROUTER_API_KEY in backend/.env "
                   "or enter keys directly in the chat settings panel.")
 
+OPENROUTER_URL = os.getenv('OPENROUTER_URL', "https://openrouter.ai/api/v1/chat/completions")
+
+# LLM calls run on their own bounded pool so slow completions can't starve other endpoints
+_llm = bulkhead('llm')
+
+# SDK clients / HTTP sessions per (provider, key), so connections are reused across requests
+_clients = LRUCache(max_entries=32)
+
+# Answers per (screenshot bytes, query, provider, model); identical questions in flight share one call
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', '600'))
+_answers = LRUCache(max_entries=int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '256')),
+                    max_bytes=16 * 1024 * 1024)
+_asks = SingleFlight()
+
+DEFAULT_MODELS = {
+    "anthropic": "claude-opus-4-8",
+    "openai": "gpt-4o",
+    "openrouter": "meta-llama/llama-3.2-11b-vision-instruct:free",
+}
+
 SITE_URL = "http://localhost:3000"
 APP_NAME = "Trading Dashboard Assistant"
 
@@ -36,21 +64,66 @@ SYSTEM_PROMPT = (
 )
 
 
-def _save_screenshot(base64_image: str):
-    if ',' in base64_image:
-        base64_image = base64_image.split(',')[1]
+def _decode_screenshot(screenshot: str):
+    """Data URL or bare base64 → (image bytes, base64 payload); ValueError if it is neither."""
+    try:
+        if ',' in screenshot:
+            screenshot = screenshot.split(',')[1]
+        return base64.b64decode(screenshot), screenshot
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError("Invalid screenshot — expected a base64 image or data URL.") from None
+
+
+def _save_screenshot(image: bytes):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filepath = os.path.join(SCREENSHOT_DIR, f'dashboard_{timestamp}.jpg')
     with open(filepath, 'wb') as f:
-        f.write(base64.b64decode(base64_image))
-    return filepath, base64_image
-
-
-def _analyze_anthropic(base64_image, query, api_key=None, model=None):
+        f.write(image)
+    return filepath
+
+
+def _client(provider, key):
+    """Reusable client for ``provider`` authenticated with ``key``."""
+    cache_key = (provider, hashlib.sha256(key.encode()).hexdigest())
+    client = _clients.get(cache_key)
+    if client is None:
+        if provider == "anthropic":
+            client = anthropic.Anthropic(api_key=key, timeout=_llm.timeout)
+        elif provider == "openai":
+            client = OpenAI(api_key=key, timeout=_llm.timeout)
+        else:
+            client = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=_llm.workers)
+            client.mount('https://', adapter)
+            client.mount('http://', adapter)
+            client.headers.update({
+                "Authorization": f"Bearer {key}",
+                "HTTP-Referer": SITE_URL,
+                "X-Title": APP_NAME,
+                "Content-Type": "application/json",
+            })
+        _clients.put(cache_key, client, 0)
+    return client
+
+
+def _answer_key(image, query, provider, model):
+    h = hashlib.blake2b(digest_size=20)
+    for part in (image or b'', query.encode(), provider.encode(), model.encode()):
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+def _remember(answer_key, answer):
+    """Cache an answer; refusals and tool-only replies (no text) aren't worth keeping."""
+    if isinstance(answer, str) and answer:
+        _answers.put(answer_key, answer, len(answer), expires_at=time.time() + CHAT_CACHE_TTL)
+
+
+def _anthropic_request(base64_image, query, api_key=None, model=None):
     key = api_key or ANTHROPIC_API_KEY
     if not key:
         raise ValueError("No Anthropic API key — add one in the chat settings panel or set ANTHROPIC_API_KEY in backend/.env")
-    client = anthropic.Anthropic(api_key=key)
 
     content = []
     if base64_image:
@@ -60,39 +133,61 @@ def _analyze_anthropic(base64_image, query, api_key=None, model=None):
         })
     content.append({"type": "text", "text": query})
 
-    response = client.messages.create(
-        model=model or "claude-opus-4-8",
+    return _client("anthropic", key), dict(
+        model=model or DEFAULT_MODELS["anthropic"],
         max_tokens=1024,
         thinking={"type": "adaptive"},
         system=SYSTEM_PROMPT,
         messages=[{"role": "user", "content": content}],
     )
+
+
+def _analyze_anthropic(base64_image, query, api_key=None, model=None):
+    client, params = _anthropic_request(base64_image, query, api_key, model)
+    response = client.messages.create(**params)
     return next(b.text for b in response.content if b.type == "text")
 
 
-def _analyze_openai(base64_image, query, api_key=None, model=None):
+def _stream_anthropic(base64_image, query, api_key=None, model=None):
+    client, params = _anthropic_request(base64_image, query, api_key, model)
+    with client.messages.stream(**params) as stream:
+        yield from stream.text_stream
+
+
+def _openai_request(base64_image, query, api_key=None, model=None):
     key = api_key or OPENAI_API_KEY
     if not key:
         raise ValueError("No OpenAI API key — add one in the chat settings panel or set OPENAI_API_KEY in backend/.env")
-    client = OpenAI(api_key=key)
 
     content = []
     if base64_image:
         content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
     content.append({"type": "text", "text": query})
 
-    response = client.chat.completions.create(
-        model=model or "gpt-4o",
+    return _client("openai", key), dict(
+        model=model or DEFAULT_MODELS["openai"],
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": content},
         ],
         max_tokens=1024,
     )
+
+
+def _analyze_openai(base64_image, query, api_key=None, model=None):
+    client, params = _openai_request(base64_image, query, api_key, model)
+    response = client.chat.completions.create(**params)
     return response.choices[0].message.content
 
 
-def _analyze_openrouter(base64_image, query, api_key=None, model=None):
+def _stream_openai(base64_image, query, api_key=None, model=None):
+    client, params = _openai_request(base64_image, query, api_key, model)
+    for chunk in client.chat.completions.create(**params, stream=True):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _openrouter_request(base64_image, query, api_key=None, model=None):
     key = api_key or OPENROUTER_API_KEY
     if not key:
         raise ValueError("No OpenRouter API key — add one in the chat settings panel or set REACT_APP_OPENROUTER_API_KEY in backend/.env")
@@ -101,31 +196,54 @@ def _analyze_openrouter(base64_image, query, api_key=None, model=None):
     if base64_image:
         content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
 
-    payload = {
-        "model": model or "meta-llama/llama-3.2-11b-vision-instruct:free",
+    return _client("openrouter", key), {
+        "model": model or DEFAULT_MODELS["openrouter"],
         "messages": [{"role": "user", "content": content}],
     }
-    headers = {
-        "Authorization": f"Bearer {key}",
-        "HTTP-Referer": SITE_URL,
-        "X-Title": APP_NAME,
-        "Content-Type": "application/json",
-    }
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers=headers, json=payload, timeout=30,
-    )
+
+
+def _analyze_openrouter(base64_image, query, api_key=None, model=None):
+    session, payload = _openrouter_request(base64_image, query, api_key, model)
+    response = session.post(OPENROUTER_URL, json=payload, timeout=_llm.timeout)
     if response.status_code != 200:
         raise Exception(f"OpenRouter {response.status_code}: {response.text[:200]}")
     return response.json()['choices'][0]['message']['content']
 
 
+def _stream_openrouter(base64_image, query, api_key=None, model=None):
+    session, payload = _openrouter_request(base64_image, query, api_key, model)
+    with session.post(OPENROUTER_URL, json={**payload, "stream": True}, timeout=_llm.timeout,
+                      stream=True) as response:
+        if response.status_code != 200:
+            raise Exception(f"OpenRouter {response.status_code}: {response.text[:200]}")
+        for line in response.iter_lines(decode_unicode=True):
+            # SSE: "data: {chunk}" lines, ": comment" keep-alives, "data: [DONE]" at the end
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if 'error' in chunk:
+                raise Exception(f"OpenRouter: {chunk['error'].get('message', chunk['error'])}")
+            text = (chunk.get('choices') or [{}])[0].get('delta', {}).get('content')
+            if text:
+                yield text
+
+
 _PROVIDERS = {
     "anthropic": _analyze_anthropic,
     "openai": _analyze_openai,
     "openrouter": _analyze_openrouter,
 }
 
+# Same providers, yielding text as it is generated
+_STREAMERS = {
+    "anthropic": _stream_anthropic,
+    "openai": _stream_openai,
+    "openrouter": _stream_openrouter,
+}
+
 def _default_provider():
     if ANTHROPIC_API_KEY: return "anthropic"
     if OPENAI_API_KEY:    return "openai"
@@ -133,29 +251,110 @@ def _default_provider():
     return "anthropic"
 
 
-@chatbot_bp.route('/api/chat', methods=['POST'])
-def analyze_dashboard():
-    data = request.json
+def _chat_request(data):
+    """Chat request body → (query, provider, model, api_key, image bytes, base64 image)."""
     query    = data.get('query', "What can you tell me about this trading dashboard?")
     screenshot = data.get('screenshot')
     provider = data.get('provider', _default_provider())
     model    = data.get('model') or None      # frontend-selected model
     api_key  = data.get('api_key') or None    # user-entered key from UI
+    image = base64_image = None
+    if screenshot and provider in _PROVIDERS:
+        image, base64_image = _decode_screenshot(screenshot)
+    return query, provider, model, api_key, image, base64_image
+
+
+@chatbot_bp.route('/api/chat', methods=['POST'])
+def analyze_dashboard():
+    try:
+        query, provider, model, api_key, image, base64_image = _chat_request(request.json)
+    except ValueError as e:
+        return jsonify({"success": False, "response": str(e)}), 400
 
     if provider not in _PROVIDERS:
         return jsonify({"success": False, "response": f"Unknown provider '{provider}'."}), 400
 
-    base64_image = None
-    if screenshot:
-        _, base64_image = _save_screenshot(screenshot)
+    # Same screenshot, question, provider and model → the answer already given
+    answer_key = _answer_key(image, query, provider, model or DEFAULT_MODELS[provider])
+    analysis = _answers.get(answer_key)
+    if analysis is not None:
+        return jsonify({"success": True, "response": analysis, "provider": provider, "from_cache": True})
 
     try:
-        analysis = _PROVIDERS[provider](base64_image, query, api_key=api_key, model=model)
-        return jsonify({"success": True, "response": analysis, "provider": provider})
+        if image is not None:
+            _save_screenshot(image)
+        analysis, leader = _asks.do(answer_key, _llm.call, _PROVIDERS[provider], base64_image, query,
+                                    api_key=api_key, model=model)
+        if leader:
+            _remember(answer_key, analysis)
+        return jsonify({"success": True, "response": analysis, "provider": provider, "from_cache": False})
+    except (BulkheadFull, CallTimeout) as e:
+        return jsonify({"success": False, "response": str(e), "provider": provider}), \
+            e.http_status, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"success": False, "response": str(e), "provider": provider}), 500
 
 
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@chatbot_bp.route('/api/chat/stream', methods=['POST'])
+def stream_dashboard_analysis():
+    """/api/chat as server-sent events, so the answer shows up as it is generated.
+
+    Events: ``start`` {provider, model}, then ``token`` {text} per chunk, then
+    ``done`` {provider, from_cache} — or ``error`` {message} if the provider fails
+    mid-way.  A cached answer comes back as a single token.
+    """
+    try:
+        query, provider, model, api_key, image, base64_image = _chat_request(request.json)
+    except ValueError as e:
+        return jsonify({"success": False, "response": str(e)}), 400
+
+    if provider not in _STREAMERS:
+        return jsonify({"success": False, "response": f"Unknown provider '{provider}'."}), 400
+
+    model_used = model or DEFAULT_MODELS[provider]
+    answer_key = _answer_key(image, query, provider, model_used)
+    cached = _answers.get(answer_key)
+
+    def events():
+        if cached is not None:
+            yield _sse('start', {'provider': provider, 'model': model_used})
+            yield _sse('token', {'text': cached})
+            yield _sse('done', {'provider': provider, 'from_cache': True})
+            return
+        with _llm.slot():
+            yield _sse('start', {'provider': provider, 'model': model_used})
+            parts = []
+            try:
+                if image is not None:
+                    _save_screenshot(image)
+                for text in _STREAMERS[provider](base64_image, query, api_key=api_key, model=model):
+                    parts.append(text)
+                    yield _sse('token', {'text': text})
+            except Exception as e:
+                yield _sse('error', {'message': str(e)})
+                return
+            _remember(answer_key, ''.join(parts))
+            yield _sse('done', {'provider': provider, 'from_cache': False})
+
+    stream = events()
+    try:
+        first = next(stream)        # takes an LLM slot (or is turned away) before anything is sent
+    except BulkheadFull as e:
+        return jsonify({"success": False, "response": str(e), "provider": provider}), \
+            e.http_status, {'Retry-After': '1'}
+
+    def resumed():
+        yield first
+        yield from stream
+
+    return Response(stream_with_context(resumed()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @chatbot_bp.route('/api/chat/providers', methods=['GET'])
 def list_providers():
     available = []
@@ -0,0 +1,67 @@
+# encoded_body.py
+"""Response bodies with a strong ETag and memoized compressed variants.
+
+An ``EncodedBody`` is what the hot cache stores: the JSON bytes, an ETag
+derived from their content, and a gzip/brotli copy made the first time a
+client asks for that encoding — later hits send the stored copy instead of
+compressing again.  Brotli is used when the ``brotli`` package is installed.
+"""
+import hashlib
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:         # gzip only
+    brotli = None
+
+# Bodies smaller than this go out as they are; compressing them isn't worth a round of CPU
+MIN_COMPRESS_SIZE = 1024
+
+
+def _gzip(data):
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)          # wbits 31 → gzip container
+    return c.compress(data) + c.flush()
+
+
+_COMPRESSORS = {'gzip': _gzip}
+if brotli is not None:
+    _COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=5)
+
+# Preference order when the client accepts several equally
+ENCODINGS = tuple(c for c in ('br', 'gzip') if c in _COMPRESSORS)
+
+
+class EncodedBody:
+    __slots__ = ('body', 'etag', '_variants', '_lock')
+
+    def __init__(self, body, etag=None):
+        """``etag`` shares another body's tag when both carry the same content
+        (e.g. fresh and cached copies that differ only in ``from_cache``)."""
+        self.body = body
+        self.etag = etag or hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.body)
+
+    def variant(self, coding):
+        """The body in ``coding`` ('gzip' / 'br'); None for identity, unknown or tiny bodies."""
+        if coding not in _COMPRESSORS or len(self.body) < MIN_COMPRESS_SIZE:
+            return None
+        with self._lock:
+            data = self._variants.get(coding)
+            if data is None:
+                data = self._variants[coding] = _COMPRESSORS[coding](self.body)
+            return data
+
+
+def gzip_stream(chunks):
+    """Gzip a stream of byte chunks, flushing after each so the client can decode as they arrive."""
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = c.compress(chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield c.flush()
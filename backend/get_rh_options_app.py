@@ -1,27 +1,45 @@
 # get_rh_options_statement.py
 import os
+import re
+import glob
+import numpy as np
 import pandas as pd
-from datetime import datetime
 import robin_stocks.robinhood as rh
+import json
+import time
 import pickle
 import logging
-from tqdm import tqdm
+from itertools import chain
+from operator import itemgetter
+
+from order_store import ORDER_ID, store_for
+from rh_session import SessionManager
 
 # Constants
-CACHE_FILE = 'option_orders_cache.pkl'
-CSV_FILE = 'orders.csv'
+CACHE_FILE = 'option_orders_cache.pkl'      # raw Robinhood orders, {order id: order}; one per account
+CSV_FILE = 'orders.csv'                       # stands for orders.db next to it (see order_store)
+SYNC_STATE_FILE = 'option_orders_sync.json'  # per account: newest updated_at seen, last sync time
+# Don't ask Robinhood again for this many seconds after a sync
+SYNC_MIN_INTERVAL = float(os.environ.get('ORDER_SYNC_MIN_INTERVAL', '300'))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def login_to_robinhood(username, password):
+def login_to_robinhood(username, password, expires_in=86400):
   logging.info("Logging into Robinhood.")
-  rh.login(username=username, password=password)
+  # per-account token pickle, so a re-login can reuse the stored token instead of asking for MFA
+  rh.login(username=username, password=password, expiresIn=int(expires_in),
+           store_session=True, pickle_name=f"_{username}" if username else '')
 
 def logout_from_robinhood():
   logging.info("Logging out from Robinhood.")
   rh.logout()
 
+# One reusable session per account; logs in lazily, only when a sync has to reach Robinhood
+sessions = SessionManager(login_to_robinhood, logout_from_robinhood,
+                          ttl=float(os.environ.get('RH_SESSION_TTL', str(23 * 3600))),
+                          idle=float(os.environ.get('RH_SESSION_IDLE', str(6 * 3600))))
+
 def load_cached_data(filename):
   if os.path.exists(filename):
       logging.info(f"Loading cached data from {filename}.")
@@ -35,103 +53,188 @@ def save_data_to_cache(data, filename):
   with open(filename, 'wb') as f:
       pickle.dump(data, f)
 
-def load_csv_data(filename):
+def load_sync_state(filename=SYNC_STATE_FILE):
   if os.path.exists(filename):
-      logging.info(f"Loading CSV data from {filename}.")
-      return pd.read_csv(filename)
-  logging.info("No CSV data found.")
-  return pd.DataFrame()
-
-def save_csv_data(data, filename):
-  logging.info(f"Saving data to CSV in {filename}.")
-  data.to_csv(filename, index=False)
-
-def format_date(date_str):
-  return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%fZ').strftime('%Y-%m-%d')
+      with open(filename) as f:
+          return json.load(f)
+  return {}
+
+def save_sync_state(state, filename=SYNC_STATE_FILE):
+  tmp = f"{filename}.tmp"
+  with open(tmp, 'w') as f:
+      json.dump(state, f, indent=2)
+  os.replace(tmp, filename)
+
+def _cache_file(account):
+  """Raw order cache of one account, so accounts never see (or rebuild from) each other's orders."""
+  if account == 'default':
+      return CACHE_FILE
+  stem, ext = os.path.splitext(CACHE_FILE)
+  return f"{stem}_{re.sub(r'[^A-Za-z0-9.@-]', '_', account)}{ext}"
+
+def load_order_cache(account='default'):
+  """Raw orders of ``account`` keyed by id (older caches stored a plain list)."""
+  orders = load_cached_data(_cache_file(account))
+  if orders is None:
+      return {}
+  if isinstance(orders, list):
+      orders = {o['id']: o for o in orders}
+  return orders
+
+def _session_ok():
+  """Cheap authenticated call; robin_stocks returns None on a rejected token instead of raising."""
+  return rh.profiles.load_account_profile() is not None
+
+def fetch_option_orders(account, password=None, updated_since=None):
+  """Orders created or changed at/after ``updated_since`` (an ISO updated_at), or all of them.
+
+  A rejected token also comes back as no orders, so an empty result is only
+  trusted once the session checks out; otherwise the session is dropped and
+  the fetch retried once after a fresh login.
+  """
+  logging.info(f"Fetching option orders from Robinhood (updated since {updated_since or 'the beginning'}).")
+  for attempt in range(2):
+      with sessions.session(account, password):
+          orders = rh.orders.get_all_option_orders(start_date=updated_since)
+          if orders or (orders is not None and _session_ok()):
+              return orders
+      sessions.invalidate(account)
+      if not attempt:
+          logging.warning(f"Robinhood session for {account} looks rejected; logging in again.")
+  raise RuntimeError(f"Robinhood rejected the session for {account}; check the login and try again.")
+
+def sync_option_orders(account='default', password=None, force=False):
+  """Fetch only orders updated since this account's high-water mark and upsert them by id.
+
+  Returns (all cached orders, orders that were new or changed).  Within
+  SYNC_MIN_INTERVAL of the last sync nothing is fetched unless ``force``.
+  """
+  state = load_sync_state()
+  mark = state.get(account, {})
+  orders = load_order_cache(account)
+  # Throttle on the sync mark alone: an account with no option orders is still synced
+  if not force and time.time() - mark.get('synced_at', 0) < SYNC_MIN_INTERVAL:
+      return orders, []
+
+  since = mark.get('updated_at') if orders else None
+  fetched = fetch_option_orders(account, password, updated_since=since)
+  changed = [o for o in fetched if orders.get(o['id']) != o]
+  for order in changed:
+      orders[order['id']] = order
+  if changed:
+      save_data_to_cache(orders, _cache_file(account))
+
+  newest = max([o['updated_at'] for o in fetched] + ([since] if since else []), default=None)
+  state[account] = {'updated_at': newest, 'synced_at': time.time()}
+  save_sync_state(state)
+  logging.info(f"Synced {len(fetched)} orders ({len(changed)} new or changed) for {account}.")
+  return orders, changed
+
+_COLUMNS = [ORDER_ID, 'Activity Date', 'Process Date', 'Settle Date', 'Instrument',
+            'Description', 'Trans Code', 'Quantity', 'Price', 'Amount']
+
+def _field(records, key):
+  """One field of every dict, as an object array (map/itemgetter run in C)."""
+  return np.array(list(map(itemgetter(key), records)), dtype=object)
+
+def _floats(values):
+  try:
+      return np.asarray(values, dtype=float)
+  except (TypeError, ValueError):
+      return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
 
-def fetch_option_orders(start_date=None):
-  logging.info("Fetching option orders from Robinhood.")
-  start_date_str = start_date.strftime('%Y-%m-%d') if start_date is not None else None
-  option_orders = rh.orders.get_all_option_orders(start_date=start_date_str)
-  save_data_to_cache(option_orders, CACHE_FILE)
-  return option_orders
+def _fan_out(nested):
+  """List of lists → (flattened items, index of the parent of each item)."""
+  counts = np.fromiter(map(len, nested), dtype=np.int64, count=len(nested))
+  return list(chain.from_iterable(nested)), np.repeat(np.arange(len(nested)), counts), counts
 
 def process_orders(option_orders):
-  logging.info("Processing option orders.")
-  orders_data = []
-  for order in tqdm(option_orders, desc="Processing Orders", unit="order"):
-      activity_date = format_date(order['created_at'])
-      process_date = format_date(order['updated_at'])
-      instrument = order['chain_symbol']
-
-      for leg in order['legs']:
-          if leg['executions']:
-              settle_date = leg['executions'][0]['settlement_date']
-              quantity = leg['executions'][0]['quantity']
-              price = leg['executions'][0]['price']
-          else:
-              settle_date = None
-              quantity = None
-              price = None
-
-          description = f"{instrument} {leg['expiration_date']} {leg['option_type']} {leg['strike_price']}" # instrument, date, type, strike
-          trans_code = 'BTO' if leg['side'] == 'buy' else 'STC' if leg['side'] == 'sell' else 'OEXP'
-          amount = order['processed_premium']
-
-          orders_data.append({
-              "Activity Date": activity_date,
-              "Process Date": process_date,
-              "Settle Date": settle_date,
-              "Instrument": instrument,
-              "Description": description,
-              "Trans Code": trans_code,
-              "Quantity": quantity,
-              "Price": price,
-              "Amount": amount
-          })
-  return pd.DataFrame(orders_data)
-
-def update_csv_cache(start_date, end_date, csv_file=CSV_FILE):
-  logging.info("Updating CSV cache.")
-  csv_data = load_csv_data(csv_file)
-  if not csv_data.empty:
-      csv_data['Activity Date'] = pd.to_datetime(csv_data['Activity Date'])
-      csv_data['Process Date'] = pd.to_datetime(csv_data['Process Date'])
-      date_range = (csv_data['Activity Date'] >= start_date) & (csv_data['Activity Date'] <= end_date)
-      if date_range.any():
-          logging.info("Data already exists in the specified date range.")
-          return csv_data[date_range]
-
-  option_orders = load_cached_data(CACHE_FILE)
-  if option_orders is None:
-      option_orders = fetch_option_orders(start_date=start_date)
-
-  new_data = process_orders(option_orders)
-  new_data['Activity Date'] = pd.to_datetime(new_data['Activity Date'])
-  new_data['Process Date'] = pd.to_datetime(new_data['Process Date'])
-  new_data = new_data[(new_data['Activity Date'] >= start_date) & (new_data['Activity Date'] <= end_date)]
-
-  if not csv_data.empty:
-      combined_data = pd.concat([csv_data, new_data]).drop_duplicates().reset_index(drop=True)
-  else:
-      combined_data = new_data
-  # Sort the combined data by 'Activity Date'
-  combined_data = combined_data.sort_values(by='Activity Date').reset_index(drop=True)
-
-  save_csv_data(combined_data, csv_file)
-  logging.info("Data has been updated in the CSV file.")
-  return combined_data
-
-def fetch_and_update_orders(username, password, start_date, end_date, csv_file=CSV_FILE):
-  login_to_robinhood(username, password)
-  try:
-      return update_csv_cache(pd.to_datetime(start_date), pd.to_datetime(end_date), csv_file)
-  finally:
-      try:
-        logout_from_robinhood()
-      except Exception as e:
-        print("Failed logging out")
-
-def delete_cache(csv_file=CSV_FILE):
-  os.remove(csv_file)
-  os.remove(CACHE_FILE)
\ No newline at end of file
+  """Raw orders → one row per execution (one per leg if it has none), built column-wise.
+
+  Orders, legs and executions are flattened once each and every column is
+  gathered with index arrays — no Python loop per order.  Amount is the
+  order's processed_premium on each leg's first row, as the legacy CSV had
+  it (so imported legacy rows still match and are replaced on sync); a
+  leg's further executions carry 0, keeping per-leg totals unchanged.
+  """
+  logging.info(f"Processing {len(option_orders)} option orders.")
+  if not option_orders:
+      return pd.DataFrame(columns=_COLUMNS)
+
+  # Order level.  Stamps are UTC ('...Z'), so the date is the first 10 characters
+  order_id = _field(option_orders, 'id')
+  created = np.array(list(map(itemgetter('created_at'), option_orders)), dtype='U10')
+  updated = np.array(list(map(itemgetter('updated_at'), option_orders)), dtype='U10')
+  symbol = _field(option_orders, 'chain_symbol')
+  premium = _floats(list(map(itemgetter('processed_premium'), option_orders)))
+
+  # Leg level
+  legs, leg_order, _ = _fan_out(list(map(itemgetter('legs'), option_orders)))
+  side = _field(legs, 'side')
+  trans_code = np.select([side == 'buy', side == 'sell'], ['BTO', 'STC'], 'OEXP').astype(object)
+  description = np.array(list(map('{} {} {} {}'.format, symbol[leg_order], _field(legs, 'expiration_date'),
+                                  _field(legs, 'option_type'), _field(legs, 'strike_price'))), dtype=object)
+
+  # Execution level: one row per execution, or a single empty row for an unfilled leg
+  execs, exec_leg, exec_counts = _fan_out(list(map(itemgetter('executions'), legs)))
+  rows_per_leg = np.maximum(exec_counts, 1)
+  row_leg = np.repeat(np.arange(len(legs)), rows_per_leg)
+  filled = np.repeat(exec_counts > 0, rows_per_leg)
+  n = len(row_leg)
+  settle = np.full(n, None, dtype=object)
+  qty, price = np.full(n, np.nan), np.full(n, np.nan)
+  if execs:
+      settle[filled] = _field(execs, 'settlement_date')
+      qty[filled] = _floats(list(map(itemgetter('quantity'), execs)))
+      price[filled] = _floats(list(map(itemgetter('price'), execs)))
+  row_order = leg_order[row_leg]
+  first_of_leg = np.ones(n, dtype=bool)
+  first_of_leg[1:] = row_leg[1:] != row_leg[:-1]
+
+  return pd.DataFrame({
+      ORDER_ID: order_id[row_order],
+      'Activity Date': created[row_order].astype(object),
+      'Process Date': updated[row_order].astype(object),
+      'Settle Date': settle,
+      'Instrument': symbol[row_order],
+      'Description': description[row_leg],
+      'Trans Code': trans_code[row_leg],
+      'Quantity': qty,
+      'Price': price,
+      'Amount': np.where(first_of_leg, premium[row_order], 0.0),
+  }, columns=_COLUMNS)
+
+def sync_order_store(csv_file=CSV_FILE, account='default', password=None, force=False):
+  """Sync new/changed orders into the indexed store and return the store."""
+  store = store_for(csv_file)
+  orders, changed = sync_option_orders(account, password, force=force)
+
+  if not store.count() and orders:
+      changed = list(orders.values())         # derived rows were cleared — rebuild from raw orders
+  if changed:
+      rows = store.upsert_orders(process_orders(changed))
+      logging.info(f"Upserted {rows} rows from {len(changed)} orders into {store.path}.")
+  return store
+
+def update_order_store(start_date, end_date, csv_file=CSV_FILE, account='default', password=None,
+                       force=False):
+  """Sync new/changed orders into the indexed store and return the rows in [start_date, end_date]."""
+  store = sync_order_store(csv_file, account, password, force)
+  data = store.query(start_date, end_date)
+  data['Activity Date'] = pd.to_datetime(data['Activity Date'])
+  data['Process Date'] = pd.to_datetime(data['Process Date'])
+  return data
+
+def fetch_and_update_orders(username, password, start_date, end_date, csv_file=CSV_FILE, force=False):
+  """Order rows in the range; Robinhood is only contacted (and logged into) if a sync is due."""
+  return update_order_store(pd.to_datetime(start_date), pd.to_datetime(end_date), csv_file,
+                            account=username or 'default', password=password, force=force)
+
+def delete_cache(csv_file=CSV_FILE, full=False):
+  """Drop the derived rows; ``full`` also forgets the raw orders and sync marks (full re-download)."""
+  store_for(csv_file).clear()
+  if full:
+      stem, ext = os.path.splitext(CACHE_FILE)
+      for path in [CACHE_FILE, *glob.glob(f"{glob.escape(stem)}_*{ext}"), SYNC_STATE_FILE]:
+          if os.path.exists(path):
+              os.remove(path)
\ No newline at end of file
@@ -0,0 +1,273 @@
+# indicators.py
+"""Technical indicators over stored bars: RSI, EMA, SMA, VWAP, ATR, Bollinger.
+
+Each indicator is a function ``fn(bars, state, *params) -> (columns, state)``:
+it computes its columns over ``bars`` as a continuation of whatever produced
+``state`` (None = from the first bar).  Recursive ones (EMA, Wilder RSI/ATR)
+run through pandas' exponential smoothing, windowed ones through rolling
+windows, so nothing loops per bar in Python.
+
+``IndicatorEngine`` memoizes the full-series result per (ticker, interval,
+indicator, params).  When the bar file changes and the bars it already saw
+are untouched, only the new bars (plus the still-forming last one) are
+computed, starting from the saved state.
+
+The stored series can have holes between windows cached at different
+times, so every run of contiguous coverage is computed on its own: state
+is reset at each run's first bar, and a window's values never depend on
+what else happens to be cached.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_DTYPE, day_ts, session_days
+from market_calendar import session_count
+
+# name → default params
+DEFAULTS = {'rsi': (14,), 'ema': (20,), 'sma': (20,), 'atr': (14,),
+            'bollinger': (20, 2.0), 'vwap': ()}
+
+
+def _smooth(x, n, alpha, state):
+    """Exponential smoothing seeded with the mean of the first ``n`` values."""
+    if state is not None and state['last'] is not None:
+        out = pd.Series(np.r_[state['last'], x]).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+        return out, {'last': out[-1] if len(out) else state['last'], 'tail': None}
+    tail = state['tail'] if state is not None else np.empty(0)
+    full = np.r_[tail, x]
+    out = np.full(len(full), np.nan)
+    if len(full) < n:
+        return out[len(tail):], {'last': None, 'tail': full}
+    seeded = np.r_[full[:n].mean(), full[n:]]
+    out[n - 1:] = pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out[len(tail):], {'last': out[-1], 'tail': None}
+
+
+def _window(x, n, state):
+    """``x`` preceded by the last n-1 values seen before it, and the new carry."""
+    tail = state['tail'] if state is not None else np.empty(0)
+    full = np.r_[tail, x]
+    return full, len(tail), {'tail': full[-(n - 1):] if n > 1 else np.empty(0)}
+
+
+def sma(bars, state, n):
+    full, k, state = _window(bars['close'], n, state)
+    mean = pd.Series(full).rolling(n).mean().to_numpy()[k:]
+    return {'': mean}, state
+
+
+def ema(bars, state, n):
+    out, state = _smooth(bars['close'], n, 2.0 / (n + 1), state)
+    return {'': out}, state
+
+
+def rsi(bars, state, n):
+    """Wilder RSI, seeded like the replay chart: mean gain/loss of the first n deltas."""
+    close = np.asarray(bars['close'], dtype=np.float64)
+    state = state or {'prev': None, 'gain': None, 'loss': None}
+    if state['prev'] is None:
+        delta = np.diff(close)
+        lead = min(1, len(close))                       # the very first bar has no delta
+    else:
+        delta = np.diff(np.r_[state['prev'], close])
+        lead = 0
+    gain, gstate = _smooth(np.where(delta > 0, delta, 0.0), n, 1.0 / n, state['gain'])
+    loss, lstate = _smooth(np.where(delta < 0, -delta, 0.0), n, 1.0 / n, state['loss'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+    out[np.isnan(gain) | np.isnan(loss)] = np.nan
+    prev = close[-1] if len(close) else state['prev']
+    return {'': np.r_[np.full(lead, np.nan), out]}, {'prev': prev, 'gain': gstate, 'loss': lstate}
+
+
+def atr(bars, state, n):
+    high, low, close = (np.asarray(bars[f], dtype=np.float64) for f in ('high', 'low', 'close'))
+    state = state or {'prev': None, 'tr': None}
+    prev_close = np.r_[np.nan if state['prev'] is None else state['prev'], close[:-1]]
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    out, tr_state = _smooth(tr, n, 1.0 / n, state['tr'])
+    prev = close[-1] if len(close) else state['prev']
+    return {'': out}, {'prev': prev, 'tr': tr_state}
+
+
+def bollinger(bars, state, n, k):
+    full, skip, state = _window(bars['close'], n, state)
+    roll = pd.Series(full).rolling(n)
+    mid = roll.mean().to_numpy()[skip:]
+    dev = roll.std(ddof=0).to_numpy()[skip:] * k
+    return {'mid': mid, 'upper': mid + dev, 'lower': mid - dev}, state
+
+
+def vwap(bars, state, interval):
+    """Volume-weighted average price, re-anchored at each session's first bar."""
+    typical = (bars['high'] + bars['low'] + bars['close']) / 3.0
+    vol = bars['volume'].astype(np.float64)
+    pv = typical * vol
+    if not len(bars):
+        return {'': np.empty(0)}, state
+    day = session_days(bars['t'], interval)
+    starts = np.r_[0, np.flatnonzero(day[1:] != day[:-1]) + 1]
+    group = np.cumsum(np.isin(np.arange(len(day)), starts)) - 1
+    cum_pv, cum_v = np.cumsum(pv), np.cumsum(vol)
+    cum_pv -= (cum_pv - pv)[starts][group]
+    cum_v -= (cum_v - vol)[starts][group]
+    if state is not None and state['day'] == day[0]:   # carry the session already in progress
+        first = group == 0
+        cum_pv[first] += state['pv']
+        cum_v[first] += state['v']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(cum_v > 0, cum_pv / cum_v, np.nan)
+    return {'': out}, {'day': day[-1], 'pv': cum_pv[-1], 'v': cum_v[-1]}
+
+
+_FUNCS = {'rsi': rsi, 'ema': ema, 'sma': sma, 'atr': atr, 'bollinger': bollinger, 'vwap': vwap}
+
+
+def parse_spec(spec):
+    """``'rsi'``, ``'ema:50'``, ``'bollinger:20:2'`` or ``{'name': 'ema', 'params': [50]}``
+    → (name, params).  Raises ValueError on unknown names or bad params."""
+    if isinstance(spec, dict):
+        name, params = spec.get('name', ''), spec.get('params') or []
+        if not isinstance(params, (list, tuple)):
+            params = [params]
+    else:
+        name, *params = str(spec).split(':')
+    name = name.strip().lower()
+    if name not in _FUNCS:
+        raise ValueError(f"unknown indicator {name!r} (expected one of {', '.join(_FUNCS)})")
+    defaults = DEFAULTS[name]
+    if len(params) > len(defaults):
+        raise ValueError(f"{name} takes at most {len(defaults)} parameter(s)")
+    params = [type(d)(p) for d, p in zip(defaults, params)] + list(defaults[len(params):])
+    if params and params[0] < 1:
+        raise ValueError(f"{name} period must be at least 1")
+    return name, tuple(params)
+
+
+def column_names(name, params, outputs):
+    """Payload column names, e.g. ``rsi_14`` or ``bollinger_20_2_upper``."""
+    base = '_'.join([name] + [f"{p:g}" if isinstance(p, float) else str(p) for p in params])
+    return {out: f"{base}_{out}" if out else base for out in outputs}
+
+
+def compute(bars, name, params, interval, state=None):
+    """Run one indicator over ``bars`` (continuing from ``state``)."""
+    fn = _FUNCS[name]
+    if name == 'vwap':
+        return fn(bars, state, interval)
+    return fn(bars, state, *params)
+
+
+def coverage_breaks(t, segments):
+    """Indices of ``t`` (sorted bar times) that start a new run of contiguous coverage.
+
+    ``segments`` are the store's ``[start, end, ...]`` coverage dates; two
+    segments with no trading session between them form one run.
+    """
+    runs = []
+    for start, end, *_ in sorted(segments, key=lambda seg: seg[0]):
+        if runs and (start <= runs[-1][1] or session_count(runs[-1][1], start) == 0):
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([start, end])
+    if not len(t):
+        return np.empty(0, dtype=np.int64)
+    starts = np.array([day_ts(r[0]) for r in runs], dtype=np.int64)
+    ends = np.array([day_ts(r[1]) for r in runs], dtype=np.int64)
+    run = np.searchsorted(starts, t, 'right') - 1
+    inside = (run >= 0) & (t < ends[np.maximum(run, 0)])
+    label = np.where(inside, 2 * run + 1, 2 * run + 2)     # odd: inside a run, even: the hole after it
+    return np.flatnonzero(label[1:] != label[:-1]) + 1
+
+
+class IndicatorEngine:
+    """Memoized indicator series over a BarStore, extended incrementally as bars arrive."""
+
+    def __init__(self, store, max_entries=256):
+        self.store = store
+        self.max_entries = max_entries
+        self._memo = OrderedDict()          # (ticker, interval, name, params) → entry dict
+        self._lock = threading.Lock()
+        self.full = 0                       # full recomputations
+        self.extended = 0                   # incremental extensions
+        self.hits = 0
+
+    def _build(self, bars, breaks, name, params, interval, entry=None):
+        """Compute the columns for ``bars``; reuse ``entry``'s state for the prefix it covered.
+
+        State restarts at every index in ``breaks``.  The saved state stops
+        one bar short of the end, since the last bar of a live session keeps
+        changing until it closes.
+        """
+        if entry is not None:
+            n = entry['stable']
+            head = {k: v[:n] for k, v in entry['columns'].items()}
+            state = entry['state']
+        else:
+            n, head, state = 0, None, None
+        stable = max(len(bars) - 1, n)
+        starts = set(breaks.tolist()) | {0}
+        edges = [n] + [int(b) for b in breaks if n < b < stable] + [stable]
+        parts = [head] if head is not None else []
+        for a, b in zip(edges, edges[1:]):
+            cols, state = compute(bars[a:b], name, params, interval, None if a in starts else state)
+            parts.append(cols)
+        last, _ = compute(bars[stable:], name, params, interval, None if stable in starts else state)
+        parts.append(last)
+        columns = {k: np.concatenate([p[k] for p in parts]) for k in last}
+        return {'columns': columns, 'state': state, 'stable': stable, 't': bars['t'].copy(),
+                'breaks': breaks, 'crc': zlib.crc32(np.ascontiguousarray(bars[:stable]).tobytes())}
+
+    def series(self, ticker, interval, name, params):
+        """(bar times, {output: values}) over every stored bar of ticker/interval."""
+        key = (ticker, interval, name, params)
+        version = self.store.version(ticker)
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is not None:
+                self._memo.move_to_end(key)
+        if entry is not None and entry['version'] == version:
+            self.hits += 1
+            return entry['t'], entry['columns']
+        bars = np.asarray(self.store.read(ticker, interval), dtype=BAR_DTYPE)
+        breaks = coverage_breaks(bars['t'], self.store.segments(ticker, interval, 'coverage'))
+        reuse = None
+        if entry is not None and len(bars) >= entry['stable']:
+            n = entry['stable']
+            prefix = np.ascontiguousarray(bars[:n]).tobytes()
+            if zlib.crc32(prefix) == entry['crc'] and np.array_equal(
+                    breaks[breaks < n], entry['breaks'][entry['breaks'] < n]):
+                reuse = entry
+        entry = self._build(bars, breaks, name, params, interval, reuse)
+        entry['version'] = version
+        if reuse is not None:
+            self.extended += 1
+        else:
+            self.full += 1
+        with self._lock:
+            self._memo[key] = entry
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return entry['t'], entry['columns']
+
+    def window(self, ticker, interval, name, params, bars):
+        """Indicator columns aligned with ``bars`` (a contiguous slice of the stored series)."""
+        t = bars['t']
+        times, columns = self.series(ticker, interval, name, params)
+        lo = np.searchsorted(times, t[0]) if len(t) else 0
+        hi = lo + len(t)
+        if hi <= len(times) and np.array_equal(times[lo:hi], t):
+            return {k: v[lo:hi] for k, v in columns.items()}
+        # the file changed under us — compute over the requested bars alone
+        columns, _ = compute(np.asarray(bars, dtype=BAR_DTYPE), name, params, interval)
+        return columns
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._memo)
+        return {'entries': entries, 'hits': self.hits, 'extended': self.extended, 'full': self.full}
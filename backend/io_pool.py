@@ -0,0 +1,122 @@
+# io_pool.py
+"""Bounded executors ("bulkheads") for slow outbound calls.
+
+Handlers that wait on the network — stock-history providers, yfinance
+news, LLM chat — hand the call to their kind's bulkhead instead of running
+it inline.  A bulkhead admits at most ``workers + queue`` calls at a time;
+past that a call fails at once with ``BulkheadFull`` rather than parking
+another server thread, and a caller stops waiting after ``timeout``
+seconds (the call keeps its slot until it really finishes).  So however
+slow one kind of upstream gets, it can only ever tie up a fixed number of
+request threads, and unrelated endpoints keep theirs.
+
+Sizes come from ``IO_<KIND>_WORKERS`` / ``IO_<KIND>_QUEUE`` /
+``IO_<KIND>_TIMEOUT`` (seconds, 0 = wait forever).
+"""
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# kind → (workers, queue, timeout seconds)
+DEFAULTS = {'history': (8, 8, 90.0), 'news': (4, 4, 15.0), 'llm': (4, 4, 60.0)}
+
+
+class BulkheadFull(RuntimeError):
+    """Every slot of the bulkhead is taken."""
+    http_status = 503
+
+
+class CallTimeout(TimeoutError):
+    """The call is still running after the bulkhead's timeout."""
+    http_status = 504
+
+
+class Bulkhead:
+    def __init__(self, name, workers, queue=0, timeout=None):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + queue
+        self.timeout = timeout or None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'io-{name}')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise BulkheadFull(f"too many {self.name} calls in flight ({self.capacity}); try again shortly")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self, ran):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += bool(ran)
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot while the caller does the I/O on its own thread (e.g. a streamed
+        response); raises BulkheadFull like ``call``."""
+        self._admit()
+        try:
+            yield
+        finally:
+            self._release(True)
+
+    def submit(self, fn, *args, **kwargs):
+        """Start ``fn(*args, **kwargs)`` on this bulkhead's threads and return its future;
+        raises BulkheadFull like ``call``.  The caller does its own waiting."""
+        self._admit()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(False)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """``fn(*args, **kwargs)`` on this bulkhead's threads; its result or exception."""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise CallTimeout(f"{self.name} call still running after {self.timeout:g}s") from None
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._in_flight
+        return {'workers': self.workers, 'capacity': self.capacity, 'timeout': self.timeout,
+                'in_flight': in_flight, 'completed': self.completed,
+                'rejected': self.rejected, 'timeouts': self.timeouts}
+
+
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+def bulkhead(kind):
+    """The process-wide bulkhead for ``kind`` (created on first use)."""
+    with _bulkheads_lock:
+        b = _bulkheads.get(kind)
+        if b is None:
+            workers, queue, timeout = DEFAULTS.get(kind, (4, 4, 30.0))
+            env = f'IO_{kind.upper()}'
+            b = _bulkheads[kind] = Bulkhead(
+                kind,
+                workers=int(os.environ.get(f'{env}_WORKERS', workers)),
+                queue=int(os.environ.get(f'{env}_QUEUE', queue)),
+                timeout=float(os.environ.get(f'{env}_TIMEOUT', timeout)))
+        return b
+
+
+def stats():
+    with _bulkheads_lock:
+        return {kind: b.stats() for kind, b in _bulkheads.items()}
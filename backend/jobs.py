@@ -0,0 +1,103 @@
+# jobs.py
+"""Background jobs with progress, for warm-up work nobody is waiting on.
+
+A job is a ``plan`` callable returning ``[(label, fn), ...]``; it is expanded
+on the job's own driver thread and the steps run on a pool shared by every
+job, so concurrency across all jobs is bounded by ``workers``.  Jobs carry a
+``key``: submitting a key that already has a job returns that job instead
+of queueing the same work twice.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class Job:
+    MAX_ERRORS = 20
+
+    def __init__(self, name, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.key = key
+        self.status = 'queued'             # queued → running → done | failed
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.errors = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        finished = self.done + self.failed
+        return {'id': self.id, 'name': self.name, 'status': self.status,
+                'total': self.total, 'done': self.done, 'failed': self.failed,
+                'progress': finished / self.total if self.total else (1.0 if not self.active else 0.0),
+                'errors': list(self.errors), 'created_at': self.created_at,
+                'started_at': self.started_at, 'finished_at': self.finished_at}
+
+
+class JobQueue:
+    def __init__(self, workers=2, keep=100):
+        self.workers = workers
+        self.keep = keep
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='job')
+        self._jobs = OrderedDict()          # id → Job, oldest first
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name, plan, key=None):
+        """Queue ``plan`` as a job (or return the job already holding ``key``)."""
+        with self._lock:
+            if key is not None and key in self._by_key:
+                return self._by_key[key]
+            job = Job(name, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job
+            while len(self._jobs) > self.keep:
+                old = next(iter(self._jobs.values()))
+                if old.active:
+                    break
+                del self._jobs[old.id]
+                if self._by_key.get(old.key) is old:
+                    del self._by_key[old.key]
+        threading.Thread(target=self._drive, args=(job, plan), name=f'job-{job.id}',
+                         daemon=True).start()
+        return job
+
+    def _drive(self, job, plan):
+        job.status, job.started_at = 'running', time.time()
+        try:
+            steps = list(plan())
+            job.total = len(steps)
+            futures = {self._pool.submit(fn): label for label, fn in steps}
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                    job.done += 1
+                except Exception as exc:
+                    job.failed += 1
+                    if len(job.errors) < Job.MAX_ERRORS:
+                        job.errors.append(f"{futures[fut]}: {exc}")
+            job.status = 'done'
+        except Exception as exc:
+            job.errors.append(str(exc))
+            job.status = 'failed'
+        job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {'workers': self.workers, 'jobs': len(jobs),
+                'active': sum(j.active for j in jobs)}
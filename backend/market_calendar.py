@@ -0,0 +1,67 @@
+# market_calendar.py
+"""NYSE regular-session calendar for the stock-history freshness policy.
+
+Only what the cache needs: which dates are sessions, and which dates' bars
+were already final at a given moment.  Early closes (1pm half days) are
+treated as full sessions, which only errs on the side of refetching.
+"""
+from datetime import timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr,
+    USMemorialDay, USPresidentsDay, USThanksgivingDay, nearest_workday, sunday_to_monday,
+)
+
+EXCHANGE_TZ = 'America/New_York'
+CLOSE_TIME = pd.Timedelta(hours=16)
+# Providers keep amending the last session's bars for a while after the bell
+SETTLE_DELAY = pd.Timedelta(hours=1)
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        # NYSE does not close the Friday before a Saturday New Year's Day
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-06-19', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+@lru_cache(maxsize=1)
+def _holidays():
+    days = NYSEHolidayCalendar().holidays(start='1990-01-01', end='2100-12-31')
+    return np.asarray(days, dtype='datetime64[D]')
+
+
+def is_session(date_str):
+    return bool(np.is_busday(np.datetime64(date_str, 'D'), holidays=_holidays()))
+
+
+def session_count(start, end):
+    """Number of trading sessions in ``[start, end)`` ('YYYY-MM-DD' strings)."""
+    if end <= start:
+        return 0
+    return int(np.busday_count(start, end, holidays=_holidays()))
+
+
+def settled_until(ts):
+    """First date whose bars were not yet final at epoch ``ts``.
+
+    Bars for every date before the returned 'YYYY-MM-DD' belong to sessions
+    that had closed (plus ``SETTLE_DELAY``) by ``ts`` and can never change.
+    """
+    now = pd.Timestamp(ts, unit='s', tz='UTC').tz_convert(EXCHANGE_TZ)
+    day = now.date()
+    if is_session(day.isoformat()) and now < now.normalize() + CLOSE_TIME + SETTLE_DELAY:
+        return day.isoformat()
+    return (day + timedelta(days=1)).isoformat()
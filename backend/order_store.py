@@ -0,0 +1,257 @@
+# order_store.py
+"""Indexed local store for derived option order rows (SQLite).
+
+Replaces the orders.csv read-filter-rewrite cycle: rows live in one table
+indexed on activity date, instrument and order id, range queries read only
+the matching rows, and syncing replaces just the rows of the orders that
+changed.  Column names on the way in and out are the CSV/statement ones
+('Activity Date', 'Trans Code', ...), so callers still see the same frames.
+
+``iter_chunks`` pages through a range by keyset cursor (activity date,
+rowid), so a response can be streamed in bounded chunks or split into pages
+without the server ever holding the whole history.
+
+Rows carry a key: ``{order id}:{n}`` for rows derived from Robinhood orders,
+``legacy:{content hash}:{n}`` for rows imported from an old CSV.  A derived row
+identical to a legacy one replaces it.
+"""
+import base64
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+ORDER_ID = 'Order ID'
+
+# CSV column → (SQL column, SQL type)
+COLUMNS = {
+    ORDER_ID:        ('order_id', 'TEXT'),
+    'Activity Date': ('activity_date', 'TEXT'),
+    'Process Date':  ('process_date', 'TEXT'),
+    'Settle Date':   ('settle_date', 'TEXT'),
+    'Instrument':    ('instrument', 'TEXT'),
+    'Description':   ('description', 'TEXT'),
+    'Trans Code':    ('trans_code', 'TEXT'),
+    'Quantity':      ('quantity', 'REAL'),
+    'Price':         ('price', 'REAL'),
+    'Amount':        ('amount', 'REAL'),
+}
+_DATES = ('Activity Date', 'Process Date', 'Settle Date')
+_NUMBERS = ('Quantity', 'Price', 'Amount')
+_SQL = [sql for sql, _ in COLUMNS.values()]
+_PAGE_KEY = "COALESCE(activity_date, '')"   # sort key of the orders_page index (rowid breaks ties)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS orders (
+    row_key TEXT PRIMARY KEY,
+    {', '.join(f'{sql} {typ}' for sql, typ in COLUMNS.values())}
+);
+CREATE INDEX IF NOT EXISTS orders_activity ON orders (activity_date);
+CREATE INDEX IF NOT EXISTS orders_instrument ON orders (instrument, activity_date);
+CREATE INDEX IF NOT EXISTS orders_order ON orders (order_id);
+CREATE INDEX IF NOT EXISTS orders_page ON orders (COALESCE(activity_date, ''));
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _normalize(df):
+    """Frame with CSV columns → SQL-ready frame (ISO dates, float numbers, text, None for missing)."""
+    out = pd.DataFrame(index=df.index)
+    for col, (sql, _) in COLUMNS.items():
+        s = df[col] if col in df else pd.Series(None, index=df.index, dtype=object)
+        if col in _DATES:
+            parsed = pd.to_datetime(s, errors='coerce', format='mixed')
+            s = parsed.dt.strftime('%Y-%m-%d').where(parsed.notna(), None)
+        elif col in _NUMBERS:
+            s = pd.to_numeric(s, errors='coerce')
+        else:
+            s = s.where(s.notna(), None).map(lambda v: v if v is None else str(v))
+        out[sql] = s.astype(object).where(s.notna(), None)
+    return out
+
+
+def _content_keys(rows):
+    """Legacy row key: hash of the row's contents (ignoring the order id) plus its
+    occurrence, since statements legitimately repeat identical rows."""
+    text = pd.Series('', index=rows.index, dtype=object)
+    for sql in _SQL:
+        if sql != 'order_id':
+            text = text + rows[sql].map(str) + '\x1f'
+    digest = pd.Series(pd.util.hash_array(text.to_numpy(dtype=object)), index=rows.index)
+    occurrence = digest.groupby(digest).cumcount()
+    return 'legacy:' + digest.map('{:016x}'.format) + ':' + occurrence.astype(str)
+
+
+def encode_cursor(date, rowid):
+    """Opaque page cursor for the row at (activity date, rowid)."""
+    return base64.urlsafe_b64encode(f"{date}|{rowid}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of ``encode_cursor``; raises ValueError on anything else."""
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, rowid = text.rsplit('|', 1)
+        return date, int(rowid)
+    except Exception:
+        raise ValueError(f"invalid cursor {cursor!r}") from None
+
+
+def _range_where(start_date, end_date, instrument, date_col='activity_date'):
+    where, args = [], []
+    if start_date is not None:
+        where.append(f'{date_col} >= ?')
+        args.append(pd.Timestamp(start_date).strftime('%Y-%m-%d'))
+    if end_date is not None:
+        where.append(f'{date_col} <= ?')
+        args.append(pd.Timestamp(end_date).strftime('%Y-%m-%d'))
+        if date_col != 'activity_date':
+            where.append('activity_date IS NOT NULL')
+    if instrument:
+        where.append('instrument = ?')
+        args.append(instrument)
+    return where, args
+
+
+class OrderStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn):
+        conn.execute("INSERT INTO meta VALUES ('version', '1') "
+                     "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def version(self):
+        """Write counter — changes whenever rows are added, replaced or cleared."""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    def _insert(self, conn, rows, keys):
+        cols = ['row_key'] + _SQL
+        sql = f"INSERT OR REPLACE INTO orders ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        conn.executemany(sql, zip(keys, *(rows[c].tolist() for c in _SQL)))
+
+    def upsert_orders(self, frame):
+        """Replace every row of the orders in ``frame`` (rows keyed by Order ID) with its rows."""
+        if frame is None or frame.empty:
+            return 0
+        rows = _normalize(frame)
+        legacy = _content_keys(rows)
+        n = rows.groupby('order_id', sort=False).cumcount().astype(str)
+        keys = rows['order_id'].astype(str) + ':' + n
+        with self._conn() as conn:
+            ids = rows['order_id'].dropna().unique().tolist()
+            conn.executemany('DELETE FROM orders WHERE order_id = ?', [(i,) for i in ids])
+            conn.executemany('DELETE FROM orders WHERE row_key = ?', [(k,) for k in legacy])
+            self._insert(conn, rows, keys.tolist())
+            self._bump(conn)
+        return len(rows)
+
+    def import_rows(self, frame):
+        """Add statement/CSV rows; rows without an Order ID are keyed by content."""
+        if frame is None or frame.empty:
+            return 0
+        rows = _normalize(frame)
+        with_id = rows['order_id'].notna()
+        if with_id.any():
+            self.upsert_orders(frame[with_id.to_numpy()])
+        legacy = rows[~with_id]
+        if len(legacy):
+            with self._conn() as conn:
+                self._insert(conn, legacy, _content_keys(legacy).tolist())
+                self._bump(conn)
+        return len(rows)
+
+    def query(self, start_date=None, end_date=None, instrument=None):
+        """Rows with Activity Date in [start_date, end_date] (inclusive, either may be None)."""
+        where, args = _range_where(start_date, end_date, instrument)
+        sql = f"SELECT {', '.join(_SQL)} FROM orders"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY activity_date, rowid'
+        df = pd.read_sql_query(sql, self._conn(), params=args)
+        df.columns = list(COLUMNS)
+        return df
+
+    def iter_chunks(self, start_date=None, end_date=None, instrument=None, after=None, limit=None,
+                    descending=False, chunk_size=500):
+        """Yield ``(frame, cursor)`` chunks of the rows ``query`` would return.
+
+        Rows come in (activity date, rowid) order — newest first if
+        ``descending`` — starting after the row of cursor ``after``, at most
+        ``limit`` of them.  ``cursor`` points at each chunk's last row; pass
+        it back as ``after`` to resume.  Only one chunk is in memory at a time.
+        """
+        # filter on the index expression too, so one index walk serves range and order
+        where, args = _range_where(start_date, end_date, instrument, date_col=_PAGE_KEY)
+        op, direction = ('<', 'DESC') if descending else ('>', 'ASC')
+        if after is not None:
+            where.append(f'({_PAGE_KEY}, rowid) {op} (?, ?)')
+            args.extend(decode_cursor(after))
+        sql = f"SELECT {', '.join(_SQL)}, {_PAGE_KEY}, rowid FROM orders"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f' ORDER BY {_PAGE_KEY} {direction}, rowid {direction}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        cur = self._conn().execute(sql, args)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                df = pd.DataFrame.from_records(rows, columns=list(COLUMNS) + ['_key', '_rowid'])
+                yield df[list(COLUMNS)], encode_cursor(*rows[-1][-2:])
+        finally:
+            cur.close()
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM orders')
+            self._bump(conn)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(csv_file):
+    """The store standing in for ``csv_file`` (orders.csv → orders.db next to it).
+
+    The first time, rows of an existing CSV are imported; the CSV is left as is.
+    """
+    path = os.path.splitext(os.path.abspath(csv_file))[0] + '.db'
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = OrderStore(path)
+            if store.get_meta('csv_imported') is None:
+                if os.path.exists(csv_file):
+                    store.import_rows(pd.read_csv(csv_file))
+                store.set_meta('csv_imported', os.path.abspath(csv_file))
+    return store
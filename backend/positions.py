@@ -0,0 +1,179 @@
+# positions.py
+"""Group option order legs into positions and compute their P&L.
+
+Mirrors the dashboard's client-side grouping (``computePositions`` in
+TradeReplayDemo.js): legs are keyed by ticker/expiry/type/strike parsed from
+``Description``, BTO amounts count as cost, STC amounts as proceeds, and an
+OEXP leg marks the position expired (worthless, P&L = -cost).
+
+Everything is pandas column operations plus one groupby, and the per-key
+partial sums combine associatively — so ``PositionBook`` folds only newly
+appended orders into its running aggregates instead of regrouping the
+whole account.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# "TSLA 2023-05-19 call 172.5000" / "TSLA 08/09/2024 Call 197.5000"
+_DESC_RE = r'(?:^|\s)(?P<expiry>\S+)\s+(?P<type>call|put)\s+(?P<strike>\S+)'
+
+# How partial aggregates (or single legs) combine per position key
+_AGG = {'ticker': 'first', 'expiry': 'first', 'type': 'first', 'strike': 'first',
+        'buyAmount': 'sum', 'sellAmount': 'sum', 'buyQty': 'sum', 'sellQty': 'sum',
+        'openDate': 'min', 'closeDate': 'max', 'expiryDate': 'max',
+        'expired': 'any', 'legs': 'sum'}
+
+
+def parse_amounts(col):
+    """Amount column → absolute float (handles numbers, "$1,234.00" and "(100.00)")."""
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float).abs().fillna(0.0)
+    digits = col.astype(str).str.replace(r'[^0-9.\-]', '', regex=True)
+    return pd.to_numeric(digits, errors='coerce').abs().fillna(0.0)
+
+
+def _empty_legs():
+    dates = ('openDate', 'closeDate', 'expiryDate')
+    dtypes = {'key': object, 'strike': float, 'expired': bool, 'legs': int}
+    return pd.DataFrame({col: pd.Series(dtype='datetime64[ns]' if col in dates else
+                                        dtypes.get(col, float if 'Amount' in col or 'Qty' in col else object))
+                         for col in ['key'] + list(_AGG)})
+
+
+def order_legs(orders):
+    """Order rows → one row per parseable leg with its key and signed-in columns."""
+    if orders is None or orders.empty or 'Description' not in orders:
+        return _empty_legs()
+    # Descriptions repeat once per leg — parse each distinct one once
+    codes, uniques = pd.factorize(orders['Description'].astype(str))
+    desc = pd.Series(uniques, dtype=object)
+    parts = desc.str.extract(_DESC_RE, flags=re.IGNORECASE)
+    strike = pd.to_numeric(parts['strike'], errors='coerce')
+    expiry = pd.to_datetime(parts['expiry'], errors='coerce', format='mixed')
+    parsed = pd.DataFrame({
+        'word': desc.str.strip().str.split(n=1).str[0],
+        'expiry': expiry.dt.strftime('%Y-%m-%d').fillna(parts['expiry']),
+        'type': parts['type'].str.capitalize(),
+        'strike': strike,
+        'strike_s': strike.map('{:g}'.format, na_action='ignore'),
+    }).take(codes).reset_index(drop=True)
+    ok = (parsed['type'].notna() & parsed['strike'].notna()).to_numpy()
+    orders = orders[ok].reset_index(drop=True)
+    parsed = parsed[ok].reset_index(drop=True)
+
+    ticker = parsed['word']
+    if 'Instrument' in orders:
+        ticker = orders['Instrument'].where(orders['Instrument'].notna() & (orders['Instrument'] != ''),
+                                            ticker)
+    expiry, kind, strike, strike_s = parsed['expiry'], parsed['type'], parsed['strike'], parsed['strike_s']
+
+    code = orders['Trans Code'].fillna('').astype(str).str.upper()
+    amount = parse_amounts(orders['Amount'])
+    qty = pd.to_numeric(orders['Quantity'], errors='coerce').fillna(0.0)
+    date = pd.to_datetime(orders['Activity Date'], errors='coerce')
+    buy, sell, exp = code == 'BTO', code == 'STC', code == 'OEXP'
+
+    return pd.DataFrame({
+        'key': ticker + '_' + expiry + '_' + kind + '_' + strike_s,
+        'ticker': ticker, 'expiry': expiry, 'type': kind, 'strike': strike,
+        'buyAmount': amount.where(buy, 0.0), 'sellAmount': amount.where(sell, 0.0),
+        'buyQty': qty.where(buy, 0.0), 'sellQty': qty.where(sell, 0.0),
+        'openDate': date.where(buy), 'closeDate': date.where(sell), 'expiryDate': date.where(exp),
+        'expired': exp, 'legs': 1,
+    })
+
+
+def aggregate(parts):
+    """Legs or earlier aggregates (with a ``key`` column) → one row per position key."""
+    return parts.groupby('key', sort=False).agg(_AGG)
+
+
+def finalize(agg):
+    """Aggregates → position rows with pl, gainRatio, holdDays and status."""
+    pos = agg.reset_index()
+    expired = pos['expired'].astype(bool)
+    pos['sellAmount'] = pos['sellAmount'].where(~expired, 0.0)
+    pos['pl'] = pos['sellAmount'] - pos['buyAmount']
+    pos['gainRatio'] = (pos['sellAmount'] / pos['buyAmount']).where(
+        (pos['buyAmount'] > 0) & (pos['sellAmount'] > 0))
+    end = pos['closeDate'].fillna(pos['expiryDate'])
+    pos['holdDays'] = (end - pos['openDate']).dt.days
+    closed = pos['sellQty'] >= pos['buyQty']
+    pos['status'] = np.where(expired, 'expired', np.where(closed & (pos['sellQty'] > 0), 'closed', 'open'))
+    return pos.sort_values('openDate', kind='stable').reset_index(drop=True)
+
+
+def compute_positions(orders):
+    """Whole order frame → positions (no caching)."""
+    return finalize(aggregate(order_legs(orders)))
+
+
+def _row_ids(orders):
+    """Content fingerprint per row; identical rows get distinct ids by occurrence."""
+    if not len(orders):
+        return np.empty(0, dtype=np.uint64)
+    hashes = pd.util.hash_pandas_object(orders, index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy().astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return hashes + occurrence * np.uint64(0x9E3779B97F4A7C15)
+
+
+class PositionBook:
+    """Positions of one order source, refreshed incrementally when it grows.
+
+    By default the source is a CSV file whose stat is its stamp; pass
+    ``load``/``stamp`` callables for anything else (e.g. an OrderStore).
+
+    Rows are fingerprinted by content (and occurrence); when every
+    previously seen row is still present only the unseen ones are grouped
+    and folded into the running aggregates.  Any edit or deletion falls
+    back to a full regroup.
+    """
+
+    def __init__(self, path, load=None, stamp=None):
+        self.path = path
+        self._load = load or (lambda: pd.read_csv(self.path))
+        self._stamp_fn = stamp or self._file_stamp
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._agg = aggregate(order_legs(None))
+        self._positions = finalize(self._agg)
+        self.version = 0
+        self.full = 0
+        self.incremental = 0
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def update(self, orders=None):
+        """Bring the positions up to date with the source (or with ``orders`` given directly)."""
+        with self._lock:
+            stamp = self._stamp_fn() if orders is None else None
+            if orders is None:
+                if stamp == self._stamp:
+                    return self._positions
+                orders = self._load() if stamp is not None else pd.DataFrame()
+            hashes = _row_ids(orders)
+            if len(self._hashes) and np.isin(self._hashes, hashes).all():
+                new = orders[~np.isin(hashes, self._hashes)]
+                if len(new):
+                    self._agg = aggregate(pd.concat([self._agg.reset_index(),
+                                                     order_legs(new)], ignore_index=True))
+                self.incremental += 1
+            else:
+                self._agg = aggregate(order_legs(orders))
+                self.full += 1
+            self._hashes = np.unique(hashes)
+            self._positions = finalize(self._agg)
+            self._stamp = stamp
+            self.version += 1
+            return self._positions
@@ -0,0 +1,128 @@
+# provider_clients.py
+"""Pooled market-data clients and per-key rate limits for Alpaca and Polygon.
+
+One client is built per (provider, credentials) and reused, so its HTTP
+connection pool survives between requests.  Every call first takes a token
+from that key's bucket; when the bucket is empty the caller queues until a
+token frees up (or ``max_wait`` passes) instead of failing.  Keys come from
+callers, so clients and buckets live in LRUs of ``max_keys`` entries.
+"""
+import threading
+import time
+
+from hot_cache import LRUCache
+
+
+class TokenBucket:
+    """``rate`` tokens per ``per`` seconds, bursting up to ``capacity``."""
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.rate = float(rate) / per
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.queued = 0             # callers waiting right now
+        self.throttled = 0          # callers that had to wait at all
+        self.rejected = 0           # callers that gave up after max_wait
+        self.granted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait=None):
+        """Take one token, waiting in line if needed; False if ``max_wait`` ran out."""
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        with self.cond:
+            self._refill()
+            if self.tokens < 1:
+                self.throttled += 1
+                self.queued += 1
+                try:
+                    while self.tokens < 1:
+                        wait = (1 - self.tokens) / self.rate
+                        if deadline is not None:
+                            left = deadline - time.monotonic()
+                            if left <= 0:
+                                self.rejected += 1
+                                return False
+                            wait = min(wait, left)
+                        self.cond.wait(wait)
+                        self._refill()
+                finally:
+                    self.queued -= 1
+            self.tokens -= 1
+            self.granted += 1
+            return True
+
+    def stats(self):
+        with self.cond:
+            self._refill()
+            return {'queued': self.queued, 'throttled': self.throttled,
+                    'rejected': self.rejected, 'granted': self.granted,
+                    'tokens': round(self.tokens, 2)}
+
+
+def _alpaca_client(key, secret):
+    from alpaca.data import StockHistoricalDataClient
+    return StockHistoricalDataClient(key, secret)
+
+
+def _polygon_client(key):
+    from polygon import RESTClient
+    return RESTClient(key)
+
+
+class ProviderRegistry:
+    """Shared clients and token buckets, keyed by (provider, credentials)."""
+
+    def __init__(self, limits, factories=None, max_wait=60.0, max_keys=64):
+        self.limits = limits                    # provider → (rate, per_seconds)
+        self.factories = factories or {'alpaca': _alpaca_client, 'polygon': _polygon_client}
+        self.max_wait = max_wait
+        self._clients = LRUCache(max_entries=max_keys)
+        self._buckets = LRUCache(max_entries=max_keys)
+        self._lock = threading.Lock()
+
+    def client(self, provider, *creds):
+        key = (provider,) + creds
+        client = self._clients.get(key)
+        if client is None:
+            client = self.factories[provider](*creds)
+            with self._lock:
+                existing = self._clients.get(key)
+                if existing is not None:
+                    return existing
+                self._clients.put(key, client, 0)
+        return client
+
+    def acquire(self, provider, *creds):
+        """Wait for this key's rate limit; False if the wait would exceed ``max_wait``."""
+        if provider not in self.limits:
+            return True
+        key = (provider,) + creds
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, per = self.limits[provider]
+                bucket = TokenBucket(rate, per)
+                self._buckets.put(key, bucket, 0)
+        return bucket.acquire(self.max_wait)
+
+    def stats(self):
+        """Per-provider totals across all keys."""
+        buckets = self._buckets.items()
+        clients = [key for key, _ in self._clients.items()]
+        empty = dict.fromkeys(('clients', 'keys', 'queued', 'throttled', 'rejected', 'granted'), 0)
+        out = {p: dict(empty) for p in self.limits}
+        for (provider, *_), bucket in buckets:
+            agg = out.setdefault(provider, dict(empty))
+            agg['keys'] += 1
+            for k, v in bucket.stats().items():
+                if k in agg:
+                    agg[k] += v
+        for provider, *_ in clients:
+            out.setdefault(provider, dict(empty))['clients'] += 1
+        return out
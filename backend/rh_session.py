@@ -0,0 +1,99 @@
+# rh_session.py
+"""Reusable broker sessions instead of login/logout around every request.
+
+robin_stocks keeps one global authenticated session, so ``SessionManager``
+serialises broker calls behind a lock and remembers which account is
+currently logged in.  ``session(account, password)`` logs in only when the
+account isn't the active one or its token is past its TTL — and callers only
+enter it when they actually have to reach the broker, so cache-served
+requests never authenticate.
+
+A daemon thread re-logs the active account shortly before its token
+expires and logs out accounts that have been idle for ``idle`` seconds
+(their passwords are only ever held in memory, and only until then).
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SessionManager:
+    def __init__(self, login, logout, ttl=23 * 3600, idle=6 * 3600, refresh_margin=600,
+                 check_every=60):
+        """``login(account, password, ttl)`` / ``logout()`` talk to the broker."""
+        self._login_fn = login
+        self._logout_fn = logout
+        self.ttl = ttl
+        self.idle = idle
+        self.refresh_margin = refresh_margin
+        self.check_every = check_every
+        self._lock = threading.RLock()      # held for the whole broker call
+        self._accounts = {}                 # account → {'password', 'expires_at', 'last_used'}
+        self._active = None
+        self._thread = None
+        self.logins = 0
+        self.reused = 0
+        self.refreshed = 0
+
+    def _login(self, account):
+        entry = self._accounts[account]
+        self._login_fn(account, entry['password'], self.ttl)
+        entry['expires_at'] = time.time() + self.ttl
+        self._active = account
+        self.logins += 1
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='rh-session-refresh',
+                                            daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def session(self, account, password=None):
+        """Hold an authenticated broker session for ``account`` for the duration of the block."""
+        with self._lock:
+            entry = self._accounts.setdefault(account, {'password': None, 'expires_at': 0,
+                                                        'last_used': 0})
+            if password:
+                entry['password'] = password
+            if self._active != account or time.time() >= entry['expires_at']:
+                self._login(account)
+            else:
+                self.reused += 1
+            entry['last_used'] = time.time()
+            self._start()
+            yield
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.check_every)
+            try:
+                self.refresh()
+            except Exception as exc:
+                logging.warning(f"Broker session refresh failed: {exc}")
+
+    def refresh(self):
+        """Renew the active session if it is about to expire; drop idle accounts."""
+        now = time.time()
+        with self._lock:
+            for account, entry in list(self._accounts.items()):
+                if now - entry['last_used'] > self.idle:
+                    if account == self._active:
+                        self._logout_fn()
+                        self._active = None
+                    del self._accounts[account]
+                elif account == self._active and entry['expires_at'] - now < self.refresh_margin:
+                    self._login(account)
+                    self.refreshed += 1
+
+    def invalidate(self, account):
+        """Forget an account's session (e.g. after the broker rejected its token)."""
+        with self._lock:
+            if account in self._accounts:
+                self._accounts[account]['expires_at'] = 0
+
+    def stats(self):
+        with self._lock:
+            return {'active': self._active is not None, 'accounts': len(self._accounts),
+                    'logins': self.logins, 'reused': self.reused, 'refreshed': self.refreshed}
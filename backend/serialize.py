@@ -0,0 +1,109 @@
+# serialize.py
+"""Column-at-a-time JSON serialisation for DataFrames.
+
+Every conversion (NaN/inf → None, dates → ISO strings or epoch seconds,
+numpy scalars → Python numbers) is done on whole columns, so the only
+per-row Python work left is the final ``zip`` into record dicts.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def clean_value(key, value, date_fields=()):
+    """Normalise a single value: NaN→None, dates formatted, numbers kept as numbers.
+
+    Only used for object columns holding mixed types.
+    """
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if key in date_fields:
+        try:
+            return str(pd.to_datetime(value).strftime('%Y-%m-%d'))
+        except Exception:
+            return str(value) if value is not None else None
+    if isinstance(value, (np.floating, np.integer)):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _with_nulls(values, mask):
+    if not mask.any():
+        return values.tolist()
+    out = values.astype(object)
+    out[mask] = None
+    return out.tolist()
+
+
+def float_column(values):
+    """Float array → list with NaN/±inf as None."""
+    a = np.asarray(values, dtype=np.float64)
+    return _with_nulls(a, ~np.isfinite(a))
+
+
+def _datetime_column(s, epoch):
+    nat = s.isna().to_numpy()
+    if epoch:
+        utc = s.dt.tz_convert('UTC').dt.tz_localize(None) if s.dt.tz is not None else s
+        secs = np.asarray(utc, dtype='datetime64[s]').astype(np.int64)
+        return _with_nulls(secs, nat)
+    text = s.dt.strftime('%Y-%m-%dT%H:%M:%S')
+    if s.dt.tz is not None:
+        text = text + s.dt.strftime('%z').str.replace(r'(\d\d)$', r':\1', regex=True)
+    return _with_nulls(text.to_numpy(dtype=object), nat)
+
+
+def _date_field_column(s, epoch):
+    """Columns like 'Activity Date': anything parseable → 'YYYY-MM-DD', the rest as str."""
+    parsed = pd.to_datetime(s, errors='coerce', format='mixed') \
+        if not pd.api.types.is_datetime64_any_dtype(s) else s
+    if epoch:
+        return _datetime_column(parsed, epoch=True)
+    text = parsed.dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+    missing = s.isna().to_numpy()
+    unparsed = parsed.isna().to_numpy() & ~missing
+    if unparsed.any():
+        text[unparsed] = s[unparsed].astype(str).to_numpy()
+    return _with_nulls(text, missing)
+
+
+def series_to_list(s, date_field=False, epoch=False):
+    """One column → JSON-safe Python list."""
+    if date_field:
+        return _date_field_column(s, epoch)
+    if pd.api.types.is_bool_dtype(s.dtype) and not s.isna().any():
+        return s.to_numpy(dtype=bool).tolist()
+    if pd.api.types.is_integer_dtype(s.dtype) and not s.isna().any():
+        return s.to_numpy(dtype=np.int64).tolist()
+    if pd.api.types.is_numeric_dtype(s.dtype):
+        return float_column(s.to_numpy(dtype=np.float64, na_value=np.nan))
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return _datetime_column(s, epoch)
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    if kind in ('string', 'empty'):
+        return _with_nulls(s.to_numpy(dtype=object), s.isna().to_numpy())
+    return [clean_value(s.name, v) for v in s.tolist()]
+
+
+def frame_columns(df, date_fields=(), epoch=False):
+    """DataFrame → ``{column: [values...]}`` (the columnar response shape)."""
+    return {col: series_to_list(df[col], col in date_fields, epoch) for col in df.columns}
+
+
+def columns_to_records(columns):
+    """``{column: [values...]}`` → ``[{column: value, ...}, ...]``."""
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+def frame_records(df, date_fields=(), epoch=False):
+    """DataFrame → clean JSON-safe records."""
+    return columns_to_records(frame_columns(df, date_fields, epoch))
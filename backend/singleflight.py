@@ -0,0 +1,50 @@
+# singleflight.py
+"""Collapse concurrent identical calls into one in-flight execution.
+
+The first caller for a key runs the function; callers arriving while it is
+still running block until it finishes and receive the same result (or the
+same exception).  Nothing is remembered once the call completes — caching is
+the bar store's job.
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0          # callers that piggy-backed on someone else's call
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run ``fn`` once per concurrent ``key``; returns ``(result, leader)``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, True
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
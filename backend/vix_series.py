@@ -0,0 +1,52 @@
+# vix_series.py
+"""Process-wide daily series (VIX) shared by every stock-history request.
+
+The whole history is loaded into memory once — from the bar store, or with a
+single download on a cold cache — and afterwards only the tail is refreshed,
+at most once per ``ttl``.  Requests slice the in-memory array by date, so a
+replay session over hundreds of positions costs no extra VIX downloads.
+"""
+import threading
+import time
+
+import numpy as np
+
+from bar_store import BAR_DTYPE, day_ts
+
+
+class DailySeries:
+    def __init__(self, store, ticker, fill, start='1990-01-01', ttl=3600):
+        """``fill(start, end)`` makes the store cover [start, end) and returns the provider call count."""
+        self.store = store
+        self.ticker = ticker
+        self.fill = fill
+        self.start = start
+        self.ttl = ttl
+        self._bars = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self, start, end):
+        calls = self.fill(start, end)
+        self._bars = np.array(self.store.read(self.ticker, '1d'))   # small: ~250 rows/year
+        self._checked = time.time()
+        return calls
+
+    def window(self, fetch_start, fetch_end):
+        """Bars in [fetch_start, fetch_end) plus the provider calls this request had to make."""
+        from datetime import datetime as _dt, timedelta as _td
+        calls = 0
+        with self._lock:
+            tomorrow = (_dt.now() + _td(days=1)).strftime('%Y-%m-%d')
+            if fetch_start < self.start:
+                calls += self.fill(fetch_start, self.start)
+                self.start = fetch_start
+                self._bars = None
+            if self._bars is None or time.time() - self._checked > self.ttl:
+                calls += self._refresh(self.start, tomorrow)
+            bars = self._bars
+        if bars is None or not len(bars):
+            return np.empty(0, dtype=BAR_DTYPE), calls
+        lo = np.searchsorted(bars['t'], day_ts(fetch_start), 'left')
+        hi = np.searchsorted(bars['t'], day_ts(fetch_end), 'left')
+        return bars[lo:hi], calls
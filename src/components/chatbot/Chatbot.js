@@ -39,6 +39,7 @@ const Chatbot = ({ dashboardRef, onOpenChange }) => {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
   const [isProcessing, setIsProcessing] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);   // first token in, answer still growing
 
   // Provider / model
   const [providers, setProviders] = useState([]);
@@ -122,8 +123,8 @@ const Chatbot = ({ dashboardRef, onOpenChange }) => {
     localStorage.setItem(`chat_key_${provider}`, value);
   };
 
-  // ── send message ──────────────────────────────────────────────────────────
-  const sendMessage = useCallback(async (query) => {
+  // ── send message (streamed: onText gets the answer so far as tokens arrive) ─
+  const sendMessage = useCallback(async (query, onText) => {
     setIsProcessing(true);
     const apiKey = apiKeys[selectedProvider];
 
@@ -134,7 +135,7 @@ const Chatbot = ({ dashboardRef, onOpenChange }) => {
         screenshot = canvas.toDataURL('image/jpeg', 0.8);
       }
 
-      const response = await fetch('http://localhost:5000/api/chat', {
+      const response = await fetch('http://localhost:5000/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -146,12 +147,42 @@ const Chatbot = ({ dashboardRef, onOpenChange }) => {
         }),
       });
 
-      const data = await response.json();
-      return data.success ? data.response : `⚠ ${data.response}`;
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        return `⚠ ${data.response || response.statusText}`;
+      }
+
+      // Server-sent events: "event: <name>\ndata: <json>\n\n"
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '', text = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf('\n\n')) >= 0) {
+          const frame = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          const event = (frame.match(/^event: (.*)$/m) || [])[1];
+          const data = (frame.match(/^data: (.*)$/m) || [])[1];
+          if (!data) continue;
+          const payload = JSON.parse(data);
+          if (event === 'token') {
+            text += payload.text;
+            setIsStreaming(true);
+            onText(text);
+          } else if (event === 'error') {
+            return `${text}${text ? '\n\n' : ''}⚠ ${payload.message}`;
+          }
+        }
+      }
+      return text || '⚠ Empty response';
     } catch (err) {
       return '⚠ Connection error — is the backend running?';
     } finally {
       setIsProcessing(false);
+      setIsStreaming(false);
     }
   }, [selectedProvider, selectedModel, apiKeys, includeScreenshot, dashboardRef]);
 
@@ -161,8 +192,18 @@ const Chatbot = ({ dashboardRef, onOpenChange }) => {
     const userMessage = input.trim();
     setInput('');
     setMessages(prev => [...prev, { type: 'user', content: userMessage }]);
-    const response = await sendMessage(userMessage);
-    setMessages(prev => [...prev, { type: 'bot', content: response, provider: selectedProvider, model: selectedModel }]);
+    // the bot bubble appears with the first token and grows in place
+    const botMessage = { type: 'bot', provider: selectedProvider, model: selectedModel };
+    let shown = false;
+    const showText = (content) => {
+      const replace = shown;
+      shown = true;
+      setMessages(prev => replace
+        ? [...prev.slice(0, -1), { ...botMessage, content }]
+        : [...prev, { ...botMessage, content }]);
+    };
+    const response = await sendMessage(userMessage, showText);
+    showText(response);
   };
 
   const handleKeyDown = (e) => {
@@ -371,7 +412,7 @@ const Chatbot = ({ dashboardRef, onOpenChange }) => {
               <span style={{ whiteSpace: 'pre-wrap' }}>{msg.content}</span>
             </div>
           ))}
-          {isProcessing && (
+          {isProcessing && !isStreaming && (
             <div className="message bot" style={{ background: msgBotBg, border: `1px solid ${msgBotBorder}`, color: textColor }}>
               <div style={{ fontSize: '10px', opacity: 0.55, marginBottom: '3px' }}>
                 {PROVIDER_LABELS[selectedProvider]} · analyzing…